@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+class ApiCache:
+    DEFAULT_PATH = "cache_data/api_cache.sqlite"
+    NEVER = float('inf') # ttl for responses that never expire
+    HOUR = 60 * 60
+    DAY = 24 * HOUR
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(responses)")]
+            if columns and 'expires_at' not in columns:
+                # older caches applied the ttl when reading, an entry written under a short ttl may have been
+                # read as permanent since, so none of them can be trusted
+                conn.execute("DROP TABLE responses")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "endpoint TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, "
+                "expires_at REAL, " # null for responses that never expire
+                "payload TEXT NOT NULL)"
+            )
+
+    def connect(self):
+        """
+        Opens a new connection to the cache database, one is opened per operation so the cache can be
+        shared between threads
+        :return: sqlite3 connection
+        """
+        return sqlite3.connect(self.path, timeout=30)
+
+    def make_key(self, endpoint, params):
+        """
+        Builds the cache key of a request
+        :param endpoint: name of the endpoint
+        :param params: dict of request parameters
+        :return: key string, identical for identical requests regardless of parameter order
+        """
+        return endpoint + "?" + json.dumps(params, sort_keys=True, default=str)
+
+    def get(self, endpoint, params):
+        """
+        Returns a cached response if it is still fresh
+        :param endpoint: name of the endpoint
+        :param params: dict of request parameters
+        :return: cached payload or None if missing or expired
+        """
+        with closing(self.connect()) as conn:
+            row = conn.execute(
+                "SELECT expires_at, payload FROM responses WHERE key = ?",
+                (self.make_key(endpoint, params),)
+            ).fetchone()
+        if row is None:
+            return None
+        expires_at, payload = row
+        if expires_at is not None and time.time() > expires_at:
+            return None
+        return json.loads(payload)
+
+    def set(self, endpoint, params, payload, ttl):
+        """
+        Stores a response in the cache. Its expiry is fixed when it is written, so a response fetched
+        while it could still change keeps its short ttl however it is read later
+        :param endpoint: name of the endpoint
+        :param params: dict of request parameters
+        :param payload: json serializable response
+        :param ttl: number of seconds the response stays fresh, NEVER for responses that don't expire
+        """
+        fetched_at = time.time()
+        expires_at = None if ttl == self.NEVER else fetched_at + ttl
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, fetched_at, expires_at, payload) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.make_key(endpoint, params), endpoint, fetched_at, expires_at, json.dumps(payload))
+            )
+
+    def clear(self, endpoint=None):
+        """
+        Removes cached responses
+        :param endpoint: only remove responses of this endpoint, all responses are removed if None
+        """
+        with closing(self.connect()) as conn, conn:
+            if endpoint is None:
+                conn.execute("DELETE FROM responses")
+            else:
+                conn.execute("DELETE FROM responses WHERE endpoint = ?", (endpoint,))
@@ -0,0 +1,230 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from Calculator import Calculator
+from Instrumentation import profiler
+from Model import Model
+
+class Backtest:
+    DEFAULT_PRICE = 1.91 # -110 on both sides, used for synthetic lines
+    CALIBRATION_BINS = 10
+
+    def __init__(self, store, features, target_col='PTS', line_feature='FORM_PTS', method='normal',
+                 retrain_every=7, min_train_rows=500, min_ev=0.0, n=1000, odds_history=None, workers=4):
+        """
+        Walk-forward backtest over the training store. The season is split into blocks of *retrain_every*
+        days, each block is priced by a model trained only on the games played before it, so no game is
+        ever priced by a model that saw it
+        :param store: TrainingStore holding the games
+        :param features: feature columns
+        :param target_col: stat the lines are settled on
+        :param line_feature: feature used as the synthetic line when the odds history has none for a game
+        :param method: 'normal' prices like Portfolio.evaluate_player, 'empirical' from the holdout residuals,
+        'mc' from monte carlo simulations like the scan
+        :param retrain_every: number of days priced by each model
+        :param min_train_rows: dates are only priced once this many earlier games are available
+        :param min_ev: a bet is placed on the side with the highest ev if it is above this
+        :param n: number of simulations per player when method is 'mc'
+        :param odds_history: dict of (player, date) to prop information, see load_odds_history
+        :param workers: number of blocks trained and priced at once
+        """
+        self.store = store
+        self.features = features
+        self.target_col = target_col
+        self.line_feature = line_feature
+        self.method = method
+        self.retrain_every = retrain_every
+        self.min_train_rows = min_train_rows
+        self.min_ev = min_ev
+        self.n = n
+        self.odds_history = odds_history or {}
+        self.workers = workers
+        self.calculator = Calculator()
+
+    def load_odds_history(self, directory):
+        """
+        Loads snapshots of the odds file (betting_data/odds.json saved once or more per day). The oldest
+        snapshot of a prop is the line that is bet, the newest is its closing line
+        :param directory: directory holding the json snapshots
+        :return: dict of (player, date) to prop information with an added 'closing' entry
+        """
+        files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.json')]
+        history = {}
+        for file in sorted(files, key=os.path.getmtime):
+            with open(file, 'r') as f:
+                snapshot = json.load(f)
+            for player, info in snapshot.items():
+                if 'over' not in info or 'under' not in info:
+                    continue
+                key = (player, pd.to_datetime(info['date'], format="%m/%d/%Y"))
+                if key not in history:
+                    history[key] = dict(info)
+                history[key]['closing'] = {'over': info['over'], 'under': info['under']}
+        self.odds_history = history
+        return history
+
+    def load_games(self, seasons=None):
+        """
+        :param seasons: only backtest these seasons, all seasons if None
+        :return: df of games with a label, sorted by date
+        """
+        columns = ['PLAYER', 'GAME_DATE'] + self.features + [self.target_col]
+        games = self.store.load(columns=columns, seasons=seasons)
+        games = games.dropna(subset=['GAME_DATE', self.target_col])
+        return games.sort_values('GAME_DATE').reset_index(drop=True)
+
+    def get_blocks(self, games):
+        """
+        Splits the dates into blocks priced by the same model
+        :param games: df returned by load_games
+        :return: list of (first date, last date) tuples, the first block starts once enough games were played
+        """
+        dates = games['GAME_DATE'].drop_duplicates()
+        rows_before = games.groupby('GAME_DATE').size().cumsum().shift(1, fill_value=0)
+        dates = dates[dates.map(rows_before) >= self.min_train_rows]
+        if dates.empty:
+            return []
+        starts = pd.date_range(dates.iloc[0], dates.iloc[-1], freq=f"{self.retrain_every}D")
+        return [(start, start + pd.Timedelta(days=self.retrain_every - 1)) for start in starts]
+
+    def get_lines(self, block):
+        """
+        Lines of every game of a block, from the odds history when available and synthetic otherwise
+        :param block: games of the block
+        :return: df with LINE, OVER_PRICE, UNDER_PRICE, CLOSING_LINE and SYNTHETIC columns, aligned with *block*
+        """
+        rows = []
+        for player, date, form in zip(block['PLAYER'], block['GAME_DATE'], block[self.line_feature]):
+            info = self.odds_history.get((player, date))
+            if info is not None:
+                closing = info.get('closing', info)
+                rows.append((info['over']['line'], info['over']['price'], info['under']['price'],
+                             closing['over']['line'], False))
+            else:
+                # books hang a half point line around the player's recent average
+                rows.append((np.floor(form) + 0.5, self.DEFAULT_PRICE, self.DEFAULT_PRICE, np.nan, True))
+        return pd.DataFrame(rows, index=block.index,
+                            columns=['LINE', 'OVER_PRICE', 'UNDER_PRICE', 'CLOSING_LINE', 'SYNTHETIC'])
+
+    def get_probabilities_over(self, model, block, lines):
+        """
+        :param model: model trained on the games before the block
+        :param block: games of the block
+        :param lines: betting lines of the games
+        :return: array of probabilities of hitting the over
+        """
+        if self.method == 'empirical':
+            return self.calculator.empirical_probability_over(lines, model.predict(block), model.residuals)
+        if self.method == 'mc':
+            preds = model.simulate_slate(block, ['REST'], self.n, np.random.default_rng(model.random_state))
+            return (preds > lines[:, None]).mean(axis=1)
+        return self.calculator.probability_over(lines, model.predict(block), model.mae)
+
+    @profiler.timed("backtest.run_block")
+    def run_block(self, games, start, end, thread_count=None):
+        """
+        Trains a model on the games before *start* and prices every game from *start* to *end*
+        :param games: df returned by load_games
+        :param start: first date of the block
+        :param end: last date of the block
+        :param thread_count: CatBoost threads of the block's model, CatBoost's default if None
+        :return: df with one row per priced game
+        """
+        block = games[(games['GAME_DATE'] >= start) & (games['GAME_DATE'] <= end)].dropna(subset=[self.line_feature])
+        if block.empty:
+            return None
+        # fixed settings, the tuned ones were cross-validated on the games the later blocks price
+        model = Model(self.features, params={'thread_count': thread_count} if thread_count else None)
+        model.train(games[games['GAME_DATE'] < start], self.target_col)
+
+        lines = self.get_lines(block)
+        p_over = self.get_probabilities_over(model, block, lines['LINE'].to_numpy())
+        over_ev = self.calculator.expected_value(p_over, lines['OVER_PRICE'].to_numpy())
+        under_ev = self.calculator.expected_value(1 - p_over, lines['UNDER_PRICE'].to_numpy())
+
+        results = pd.concat([block[['PLAYER', 'GAME_DATE', self.target_col]], lines], axis=1)
+        results = results.rename(columns={self.target_col: 'ACTUAL'})
+        results['PREDICTED'] = model.predict(block)
+        results['P_OVER'] = p_over
+        results['OUTCOME'] = np.where(over_ev >= under_ev, 'OVER', 'UNDER')
+        results['P_OUTCOME'] = np.where(over_ev >= under_ev, p_over, 1 - p_over)
+        results['EV'] = np.maximum(over_ev, under_ev)
+        results['BET'] = results['EV'] > self.min_ev
+        return results
+
+    def run(self, seasons=None):
+        """
+        Runs the backtest, blocks are trained and priced concurrently
+        :param seasons: only backtest these seasons, all seasons if None
+        :return: df with one row per priced game, including its settlement
+        """
+        games = self.load_games(seasons)
+        blocks = self.get_blocks(games)
+        if not blocks:
+            print(f"Not enough games to backtest, {self.min_train_rows} are needed before the first priced date.")
+            return pd.DataFrame()
+        thread_count = max(1, (os.cpu_count() or 1) // self.workers)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = [df for df in executor.map(lambda block: self.run_block(games, *block, thread_count), blocks)
+                       if df is not None]
+        if not results:
+            return pd.DataFrame()
+        return self.settle(pd.concat(results, ignore_index=True))
+
+    def settle(self, results):
+        """
+        Settles every priced game, pushes return the stake
+        :param results: df returned by run_block
+        :return: results with WON, PUSH, PROFIT and CLV columns added
+        """
+        is_over = results['OUTCOME'] == 'OVER'
+        results['PUSH'] = results['ACTUAL'] == results['LINE']
+        results['WON'] = ~results['PUSH'] & np.where(is_over, results['ACTUAL'] > results['LINE'],
+                                                     results['ACTUAL'] < results['LINE'])
+        price = np.where(is_over, results['OVER_PRICE'], results['UNDER_PRICE'])
+        results['PROFIT'] = np.where(results['PUSH'], 0.0, np.where(results['WON'], price - 1, -1.0))
+        # points gained against the closing line, positive when the line moved our way after the bet
+        results['CLV'] = np.where(is_over, results['CLOSING_LINE'] - results['LINE'],
+                                  results['LINE'] - results['CLOSING_LINE'])
+        return results
+
+    def calibration_table(self, results, bins=CALIBRATION_BINS):
+        """
+        Compares the predicted probability of the over with how often it hit, on every priced game
+        :param results: df returned by run
+        :param bins: number of probability bins
+        :return: df with the games, mean predicted probability and hit rate of every bin
+        """
+        hit = (results['ACTUAL'] > results['LINE']).astype(float)
+        binned = pd.cut(results['P_OVER'], np.linspace(0, 1, bins + 1), include_lowest=True)
+        table = pd.DataFrame({'P_OVER': results['P_OVER'], 'HIT': hit}).groupby(binned, observed=True)
+        return table.agg(GAMES=('HIT', 'size'), PREDICTED=('P_OVER', 'mean'), OBSERVED=('HIT', 'mean'))
+
+    def summarize(self, results):
+        """
+        :param results: df returned by run
+        :return: dict of hit rate, roi, calibration and closing line stats of the bets placed
+        """
+        if results.empty:
+            return {'games': 0, 'bets': 0}
+        bets = results[results['BET']]
+        decided = bets[~bets['PUSH']]
+        with_close = bets.dropna(subset=['CLV'])
+        hit = (results['ACTUAL'] > results['LINE']).astype(float)
+        return {
+            'games': len(results),
+            'dates': results['GAME_DATE'].nunique(),
+            'bets': len(bets),
+            'synthetic_lines': float(results['SYNTHETIC'].mean()),
+            'hit_rate': float(decided['WON'].mean()) if not decided.empty else None,
+            'profit': float(bets['PROFIT'].sum()),
+            'roi': float(bets['PROFIT'].mean()) if not bets.empty else None,
+            'mae': float((results['PREDICTED'] - results['ACTUAL']).abs().mean()),
+            'brier': float(((results['P_OVER'] - hit) ** 2).mean()),
+            'mean_p_outcome': float(bets['P_OUTCOME'].mean()) if not bets.empty else None,
+            'clv_bets': len(with_close),
+            'mean_clv': float(with_close['CLV'].mean()) if not with_close.empty else None,
+            'beat_close_rate': float((with_close['CLV'] > 0).mean()) if not with_close.empty else None
+        }
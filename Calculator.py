@@ -34,6 +34,27 @@ class Calculator:
         """
         return norm.cdf(line, loc=mean, scale=std)
 
+    def empirical_probability_over(self, line, prediction, residuals):
+        """
+        P(X > line) where X = prediction + residual and residuals are the model's sorted holdout errors
+        :param line: betting line(s)
+        :param prediction: model prediction(s)
+        :param residuals: sorted array of actual - predicted values
+        :return: probability of hitting over
+        """
+        below = np.searchsorted(residuals, np.asarray(line) - np.asarray(prediction), side='right')
+        return 1 - below / len(residuals)
+
+    def empirical_probability_under(self, line, prediction, residuals):
+        """
+        P(X <= line) where X = prediction + residual and residuals are the model's sorted holdout errors
+        :param line: betting line(s)
+        :param prediction: model prediction(s)
+        :param residuals: sorted array of actual - predicted values
+        :return: probability of hitting under
+        """
+        return 1 - self.empirical_probability_over(line, prediction, residuals)
+
     def expected_value(self, prob_win, odds_decimal):
         """
         EV = (prob_win * odds) - (1 - prob_win)
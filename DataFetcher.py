@@ -1,4 +1,3 @@
-from dateutil.utils import today
 from nba_api.stats.static import players
 from nba_api.stats.static import teams
 from nba_api.stats.endpoints import PlayerGameLogs
@@ -10,9 +9,20 @@ import numpy as np
 import requests
 import json
 import os
+import tempfile
 import time
+import threading
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from ApiCache import ApiCache
+from Slate import Slate
+from RateLimiter import TokenBucket, RateLimitError
+from OddsClient import OddsClient
+from OddsStore import OddsStore
+from TrainingStore import TrainingStore
+from Instrumentation import profiler
+from Transport import Transport
 
 class DataFetcher:
     load_dotenv()
@@ -24,32 +34,174 @@ class DataFetcher:
     DEFAULT_BOOKIE = "draftkings"
     ODDS_FILE = "betting_data/odds.json"
     STAT_COLUMNS = ['PTS', 'FGM', 'FGA', 'FG3M', 'FG3A', 'FTM', 'FTA', 'MIN']
+    FORM_STATS = ['PTS', 'FG3A', 'FG3M', 'FTA', 'FTM', 'FG2A', 'FG2M', 'MIN']
+    TARGETS = ['PTS', 'REB', 'AST', 'FG3M'] # labels written to the training data
+    # Odds API market key to the stat it is settled on, PRA is points + rebounds + assists
+    MARKETS = {
+        'player_points': 'PTS',
+        'player_rebounds': 'REB',
+        'player_assists': 'AST',
+        'player_threes': 'FG3M',
+        'player_points_rebounds_assists': 'PRA'
+    }
     FEATURES = ['HOME', 'REST', 'FORM_PTS', 'FORM_FG2A', 'FORM_FG3A',
                 'FORM_FTA', 'FG2_PCT', 'FG3_PCT', 'FT_PCT', 'FORM_MIN',
                 'OPP_PACE', 'OPP_DEF_RATING' ]
-    def __init__(self, season="2024-25", season_type="Playoffs"):
+    REQUESTS_PER_SECOND = 1.5 # average request rate shared by every thread, avoids rate-limiting
+    REQUEST_BURST = 3
+    MAX_RETRIES = 4
+    BACKOFF_SECONDS = 1.0 # doubled after every failed attempt
+    DEFAULT_TTL = ApiCache.HOUR
+    ENDPOINT_TTLS = {
+        'BoxScoreTraditionalV2': ApiCache.NEVER,
+        'CommonTeamRoster': ApiCache.DAY,
+        'TeamEstimatedMetrics': ApiCache.DAY,
+        'PlayerGameLogs': 3 * ApiCache.HOUR,
+        'PlayerGameLog': 3 * ApiCache.HOUR,
+        'TeamGameLog': 3 * ApiCache.HOUR,
+        'LeagueGameLog': 3 * ApiCache.HOUR,
+        'ScoreboardV2': ApiCache.HOUR
+    }
+    def __init__(self, season="2024-25", season_type="Playoffs", cache=None, rate_limiter=None, training_store=None,
+                 transport=None, odds_base_url=BASE_URL):
         self.season = season
         self.season_type = season_type
-
-    def get_player_stats_on_date(self, player_name, game_date):
+        self.cache = cache if cache is not None else ApiCache()
+        self.training_store = training_store if training_store is not None else TrainingStore()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else TokenBucket(self.REQUESTS_PER_SECOND,
+                                                                                      self.REQUEST_BURST)
+        self.transport = transport if transport is not None else Transport()
+        self.odds_client = OddsClient(self.ODDS_API_KEY, odds_base_url, transport=self.transport)
+        self.odds_dir = None
+        self.odds_file = self.ODDS_FILE
+        if self.transport.mode != Transport.PASSTHROUGH:
+            # recorded and replayed runs take their odds from the transport and must not touch the tracked odds file,
+            # their copy is removed by close or at the latest when the interpreter exits
+            self.odds_dir = tempfile.TemporaryDirectory(prefix="nba_odds_")
+            self.odds_file = os.path.join(self.odds_dir.name, "odds.json")
+        self.odds_store = OddsStore(self.odds_file, self.update_odds_file,
+                                    force_refresh=self.transport.mode != Transport.PASSTHROUGH)
+        self.slates = {}
+        self.slates_lock = threading.Lock()
+        self.box_scores = {}
+
+    def close(self):
+        """
+        Closes the odds client's connections and removes the odds file of a recorded or replayed run
+        """
+        self.odds_client.close()
+        if self.odds_dir is not None:
+            self.odds_dir.cleanup()
+
+    def call_endpoint(self, endpoint, ttl=None, **params):
+        """
+        Calls an nba_api endpoint through the transport and the response cache, only cache misses go through
+        the rate limiter. Replayed responses skip the cache and the rate limiter
+        :param endpoint: nba_api endpoint class
+        :param ttl: seconds a response stays fresh once cached, defaults to the endpoint's entry in ENDPOINT_TTLS
+        :param params: parameters passed to the endpoint
+        :return: dict of data set name to df
+        """
+        name = endpoint.__name__
+        if ttl is None:
+            ttl = self.ENDPOINT_TTLS.get(name, self.DEFAULT_TTL)
+
+        def request():
+            response = endpoint(**params).nba_response
+            profiler.count('api_bytes', len(response.get_response()))
+            return response.get_data_sets()
+
+        def cached_request():
+            data_sets = self.cache.get(name, params)
+            if data_sets is None:
+                profiler.count('api_calls')
+                data_sets = self.send_request(request)
+                self.cache.set(name, params, data_sets, ttl)
+            else:
+                profiler.count('cache_hits')
+            return data_sets
+
+        with profiler.span(f"nba_api.{name}"):
+            data_sets = self.transport.fetch('nba_api', name, params, cached_request)
+            return {key: pd.DataFrame(data_set['data'], columns=data_set['headers'])
+                    for key, data_set in data_sets.items()}
+
+    def send_request(self, request):
+        """
+        Sends a request once the rate limiter allows it, retrying with exponential backoff on timeouts,
+        connection errors and rate-limit responses. A request still rate-limited after the last retry raises
+        RateLimitError
+        :param request: function sending the request and returning its result
+        :return: result of the request
+        """
+        # nba_api doesn't check status codes, a rate-limited response surfaces as a body that isn't json
+        retryable = (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                     json.JSONDecodeError, RateLimitError)
+        for attempt in range(self.MAX_RETRIES + 1):
+            with profiler.span("rate_limiter.acquire"):
+                waited = self.rate_limiter.acquire()
+            if waited:
+                profiler.count('sleeps')
+                profiler.count('sleep_seconds', waited)
+            try:
+                return request()
+            except retryable as e:
+                if attempt == self.MAX_RETRIES:
+                    if isinstance(e, json.JSONDecodeError):
+                        raise RateLimitError(f"Still rate limited after {self.MAX_RETRIES} retries: {e}") from e
+                    raise
+                delay = self.BACKOFF_SECONDS * 2 ** attempt
+                print(f"Request failed ({e}), retrying in {delay}s.")
+                profiler.count('retries')
+                profiler.count('sleeps')
+                profiler.count('sleep_seconds', delay)
+                with profiler.span("backoff.sleep"):
+                    time.sleep(delay)
+
+    def get_box_scores_on_date(self, game_date):
+        """
+        Returns the traditional box score line of every player who played on a given date. A single league
+        game log request covers the whole date, the per-game box scores are only scanned if it is empty
+        :param game_date: date of the games (%m/%d/%Y)
+        :return: df with one row per player
+        """
+        if game_date in self.box_scores:
+            return self.box_scores[game_date]
+
+        # games from more than two days ago are final so their lines never change
+        finished = datetime.strptime(game_date, "%m/%d/%Y") < self.transport.today() - timedelta(days=2)
+        ttl = ApiCache.NEVER if finished else None
+        box_scores = self.call_endpoint(leaguegamelog.LeagueGameLog, ttl=ttl, season=self.season,
+                                        season_type_all_star=self.season_type, player_or_team_abbreviation='P',
+                                        date_from_nullable=game_date, date_to_nullable=game_date)['LeagueGameLog']
+        if box_scores.empty:
+            # the date may belong to another season type, fall back to the games' box scores
+            game_header = self.call_endpoint(ScoreboardV2, game_date=game_date)['GameHeader']
+            player_stats = []
+            for game_id, status in zip(game_header['GAME_ID'], game_header['GAME_STATUS_ID']):
+                # box scores of unfinished games are still changing so they can't be kept for good
+                ttl = None if status == 3 else self.DEFAULT_TTL
+                player_stats.append(self.call_endpoint(BoxScoreTraditionalV2, ttl=ttl, game_id=game_id)['PlayerStats'])
+            if player_stats:
+                box_scores = pd.concat(player_stats, ignore_index=True)
+
+        if finished:
+            self.box_scores[game_date] = box_scores
+        return box_scores
+
+    def get_player_stats_on_date(self, player_name, game_date, box_scores=None):
         """
         Returns a player's traditional box score stats for a given date
         :param player_name: full name of player
         :param game_date: date of the game
+        :param box_scores: df returned by get_box_scores_on_date for *game_date*, fetched if None
         :return player's stat-line as a dict, or None if no data found
         """
-        # Get scoreboard (contains game IDs)
-        scoreboard = ScoreboardV2(game_date=game_date)
-        game_ids = scoreboard.game_header.get_data_frame()['GAME_ID'].tolist()
-
+        if box_scores is None:
+            box_scores = self.get_box_scores_on_date(game_date)
         player_id = self.get_player_id(player_name)
-
-        # Search each game for the player
-        for game_id in game_ids:
-            time.sleep(0.6)  # avoid rate-limiting
-            boxscore = BoxScoreTraditionalV2(game_id=game_id)
-            player_stats = boxscore.player_stats.get_data_frame()
-            match = player_stats[player_stats['PLAYER_ID'] == player_id]
+        if 'PLAYER_ID' in box_scores.columns:
+            match = box_scores[box_scores['PLAYER_ID'] == player_id]
             if not match.empty:
                 return match.iloc[0].to_dict()
 
@@ -105,8 +257,8 @@ class DataFetcher:
         :return: player's last *num_games* game logs as df or None
         """
         player_id = self.get_player_id(player_name)
-        game_logs = PlayerGameLogs(player_id_nullable=player_id, season_nullable=self.season, season_type_nullable=self.season_type)
-        stats_df = game_logs.get_data_frames()[0]
+        stats_df = self.call_endpoint(PlayerGameLogs, player_id_nullable=player_id, season_nullable=self.season,
+                                      season_type_nullable=self.season_type)['PlayerGameLogs']
 
         if stats_df.empty:
             print(f"No game data available for {player_name} in {self.season}.")
@@ -125,6 +277,18 @@ class DataFetcher:
 
         return last_x_games
 
+    def get_league_player_logs(self, cutoff_date=DEFAULT_CUTOFF):
+        """
+        Fetches the game logs of every player in the league with a single request
+        :param cutoff_date: only consider games played on or after this day
+        :return: df of player game logs
+        """
+        logs = self.call_endpoint(leaguegamelog.LeagueGameLog, season=self.season,
+                                  season_type_all_star=self.season_type,
+                                  player_or_team_abbreviation='P')['LeagueGameLog']
+        logs['GAME_DATE'] = pd.to_datetime(logs['GAME_DATE'])
+        return logs[logs['GAME_DATE'] >= cutoff_date]
+
     def get_last_x_stats_in_category(self, player_name, num_games=DEFAULT_NUM_GAMES, stat=DEFAULT_STAT, cutoff_date=DEFAULT_CUTOFF):
         """
         Get players last x recordings of a statistical category
@@ -146,19 +310,15 @@ class DataFetcher:
         :param date: date to query for
         :return: list of team's playing
         """
-        scoreboard = ScoreboardV2(game_date=date)
+        # Get game headers
+        games = self.call_endpoint(ScoreboardV2, game_date=date)['GameHeader']
 
         nba_teams = teams.get_teams()
         team_id_map = {team['id']: team['full_name'] for team in nba_teams}
 
-        # Get game headers
-        games = scoreboard.game_header.get_dict()['data']
-
         # Extract teams playing
         matchups = []
-        for game in games:
-            home_team_id = game[6]  # HOME_TEAM_ID
-            away_team_id = game[7]  # VISITOR_TEAM_ID
+        for home_team_id, away_team_id in zip(games['HOME_TEAM_ID'], games['VISITOR_TEAM_ID']):
             home_team = team_id_map.get(home_team_id, f"Unknown({home_team_id})")
             away_team = team_id_map.get(away_team_id, f"Unknown({away_team_id})")
             matchups += [home_team, away_team]
@@ -180,41 +340,22 @@ class DataFetcher:
         """
         Fetch upcoming events for a given sport.
         """
-        url = f"{self.BASE_URL}/sports/{sport_key}/events"
-        params = {
-            "regions": regions,
-            "apiKey": self.ODDS_API_KEY
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Error fetching events: {response.status_code} {response.text}")
-        return response.json()
-
-    def extract_opponent(self, row):
-        """
-        Given a row, extract the opponent of the team we're interested in
-        :param row: contains matchup information
-        :return: team of interest or None if not available
-        """
-        parts = row['MATCHUP'].split(' ')
-        if '@' in parts:
-            return parts[-1]
-        elif 'vs.' in parts:
-            return parts[-1]
-        return None
+        return self.odds_client.get_upcoming_events(sport_key, regions)
 
-    def extract_home(self, row):
+    def add_matchup_columns(self, games):
         """
-        Given a matchup, extract the team we're interested in, "home" here refers to that team
-        :param row: contains matchup information
-        :return: team of interest or None if not available
+        Parses the MATCHUP column ("BOS vs. NYK" or "BOS @ NYK") into team, opponent and home columns
+        :param games: game logs containing a MATCHUP column
+        :return: games with TEAM_ABBR, OPP_TEAM_ABBR, TEAM_ID, OPP_TEAM_ID and HOME columns added
         """
-        parts = row['MATCHUP'].split(' ')
-        if '@' in parts:
-            return parts[0]
-        elif 'vs.' in parts:
-            return parts[0]
-        return None
+        parts = games['MATCHUP'].str.extract(r'^(\S+) (?:@|vs\.) (\S+)$')
+        games['TEAM_ABBR'] = parts[0]
+        games['OPP_TEAM_ABBR'] = parts[1]
+        teams_dict = {team['abbreviation']: team['id'] for team in teams.get_teams()}
+        games['TEAM_ID'] = games['TEAM_ABBR'].map(teams_dict)
+        games['OPP_TEAM_ID'] = games['OPP_TEAM_ABBR'].map(teams_dict)
+        games['HOME'] = (~games['MATCHUP'].str.contains('@', regex=False)).astype(int)
+        return games
 
     def get_opponent_def_rating_avg(self, opponent_id, game_date, num_games):
         """
@@ -224,7 +365,7 @@ class DataFetcher:
         :param num_games: number of games to consider
         :return: calculated defensive rating or None if data is missing
         """
-        game_logs = teamgamelog.TeamGameLog(team_id=opponent_id, season='2024-25').get_data_frames()[0]
+        game_logs = self.call_endpoint(teamgamelog.TeamGameLog, team_id=opponent_id, season='2024-25')['TeamGameLog']
 
         game_logs['GAME_DATE'] = pd.to_datetime(game_logs['GAME_DATE'])
 
@@ -246,58 +387,178 @@ class DataFetcher:
         return self.get_opponent_def_rating_avg(row['OPP_TEAM_ID'], row['GAME_DATE'])
 
 
-    def create_player_dataset(self, player_name, num_games):
+    def add_form_columns(self, games, num_games):
         """
-        Creates dataset for model training and saves it in csv
-        :param player_name is the player we're creating the data for
-        :param num_games is the number of games to be used in rolling average
-        :returns df of player data with class' features or None if some data is not available
+        Adds the rolling FORM_* averages of every FORM stat and REST in one grouped pass. Each game only
+        uses the *num_games* games before it, so the averages never include the game being predicted
+        :param games: game logs of one or more players, containing a PLAYER_NAME column
+        :param num_games: number of games to be used in rolling average
+        :return: games sorted by player and date with the FORM_* and REST columns added
         """
-        player_id = self.get_player_id(player_name)
-        games = playergamelog.PlayerGameLog(player_id=player_id, season=self.season).get_data_frames()[0]
-        games['OPP_TEAM_ABBR'] = games.apply(self.extract_opponent, axis=1)
-        games['TEAM_ABBR'] = games.apply(self.extract_home, axis=1)
-        teams_dict = {team['abbreviation']: team['id'] for team in teams.get_teams()}
-        games['TEAM_ID'] = games['TEAM_ABBR'].map(teams_dict)
-        games['OPP_TEAM_ID'] = games['OPP_TEAM_ABBR'].map(teams_dict)
-
-        # Ensure games are in ascending order
         games['GAME_DATE'] = pd.to_datetime(games['GAME_DATE'])
-        games = games.sort_values('GAME_DATE').reset_index(drop=True)
-
-
-        games['FORM_PTS'] = games['PTS'].shift(1).rolling(window=num_games).mean()
-        games['FORM_FG3A'] = games['FG3A'].shift(1).rolling(window=num_games).mean()
-        games['FORM_FG3M'] = games['FG3M'].shift(1).rolling(window=num_games).mean()
-        games['FORM_FTA'] = games['FTA'].shift(1).rolling(window=num_games).mean()
-        games['FORM_FTM'] = games['FTM'].shift(1).rolling(window=num_games).mean()
+        games = games.sort_values(['PLAYER_NAME', 'GAME_DATE']).reset_index(drop=True)
         games['FG2A'] = games['FGA'] - games['FG3A']
         games['FG2M'] = games['FGM'] - games['FG3M']
-        games['FORM_FG2A'] = games['FG2A'].shift(1).rolling(window=num_games).mean()
-        games['FORM_FG2M'] = games['FG2M'].shift(1).rolling(window=num_games).mean()
-        games['FORM_MIN'] = games['MIN'].shift(1).rolling(window=num_games).mean()
-        games['REST'] = games['GAME_DATE'].diff().dt.days
 
-        games = games.dropna()
-        games["FG2_PCT"] = games.apply(lambda row: (row["FORM_FG2M"] / row["FORM_FG2A"]) if row["FORM_FG2A"] != 0 else 0, axis=1)
-        games["FG3_PCT"] = games.apply(lambda row: (row["FORM_FG3M"] / row["FORM_FG3A"]) if row["FORM_FG3A"] != 0 else 0, axis=1)
-        games["FT_PCT"] = games.apply(lambda row: (row["FORM_FTM"] / row["FORM_FTA"]) if row["FORM_FTA"] != 0 else 0, axis=1)
+        by_player = games.groupby('PLAYER_NAME')
+        previous = by_player[self.FORM_STATS].shift(1)
+        form = previous.groupby(games['PLAYER_NAME']).rolling(window=num_games).mean()
+        form = form.reset_index(level=0, drop=True).add_prefix('FORM_')
+        games[form.columns] = form
+        games['REST'] = by_player['GAME_DATE'].diff().dt.days
+        return games
+
+    def get_player_games(self, player_names, workers=8, dates_from=None):
+        """
+        Fetches the season game logs of many players concurrently
+        :param player_names: players to fetch logs for
+        :param workers: number of players fetched at once
+        :param dates_from: dict of player name to the first date (%m/%d/%Y) to fetch, whole season if missing
+        :return: game logs of every player found and fetched, with a PLAYER_NAME column
+        """
+        dates_from = dates_from or {}
+
+        def fetch(player_name):
+            player_id = self.get_player_id(player_name)
+            if player_id is None:
+                return None
+            params = {'player_id': player_id, 'season': self.season}
+            if player_name in dates_from:
+                params['date_from_nullable'] = dates_from[player_name]
+            try:
+                games = self.call_endpoint(playergamelog.PlayerGameLog, **params)['PlayerGameLog']
+            except Exception as e:
+                # one failing player shouldn't keep the rest of the batch from being written
+                print(f"Could not refresh {player_name}: {e}")
+                return None
+            games['PLAYER_NAME'] = player_name
+            return games
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            logs = [games for games in executor.map(fetch, player_names) if games is not None]
+        if not logs:
+            return pd.DataFrame()
+        games = pd.concat(logs, ignore_index=True)
+        games['GAME_DATE'] = pd.to_datetime(games['GAME_DATE'])
+        return games
 
-        metrics_df = teamestimatedmetrics.TeamEstimatedMetrics(season=self.season).get_data_frames()[0]
+    def get_opponent_metrics(self):
+        """
+        Estimated metrics of every team, named as opponent features
+        :return: df with OPP_TEAM_ID, OPP_DEF_RATING and OPP_PACE columns
+        """
+        metrics_df = self.call_endpoint(teamestimatedmetrics.TeamEstimatedMetrics,
+                                        season=self.season)['TeamEstimatedMetrics']
 
         # Only focusing on opponent def rating and pace since pace will always be the same for player's team
         metrics_df_team = metrics_df[['TEAM_ID', 'E_DEF_RATING', 'E_PACE']]
-        metrics_df_team = metrics_df_team.rename(columns={'TEAM_ID': 'OPP_TEAM_ID', 'E_DEF_RATING': 'OPP_DEF_RATING', 'E_PACE': 'OPP_PACE'})
+        return metrics_df_team.rename(columns={'TEAM_ID': 'OPP_TEAM_ID', 'E_DEF_RATING': 'OPP_DEF_RATING', 'E_PACE': 'OPP_PACE'})
 
-        games = games.merge(metrics_df_team, on=['OPP_TEAM_ID' ], how='left')
+    def build_player_features(self, games, num_games, opponent_metrics):
+        """
+        Derives the training rows of raw game logs, features are computed column-wise over all players together
+        :param games: raw game logs of one or more players, containing a PLAYER_NAME column
+        :param num_games: number of games to be used in rolling average
+        :param opponent_metrics: df returned by get_opponent_metrics
+        :return: df of games that have a full rolling window, with class' features
+        """
+        games = self.add_matchup_columns(games.copy())
+        games = self.add_form_columns(games, num_games)
 
-        games['HOME'] = games['MATCHUP'].apply(lambda x: 1 if '@' not in x else 0)
+        games = games.dropna()
+        games["FG2_PCT"] = self.safe_divide(games["FORM_FG2M"], games["FORM_FG2A"])
+        games["FG3_PCT"] = self.safe_divide(games["FORM_FG3M"], games["FORM_FG3A"])
+        games["FT_PCT"] = self.safe_divide(games["FORM_FTM"], games["FORM_FTA"])
+
+        return games.merge(opponent_metrics, on=['OPP_TEAM_ID' ], how='left')
+
+    def get_rolling_state(self, games, num_games):
+        """
+        The raw rows needed to continue the rolling features of each player: his last *num_games* games
+        :param games: raw game logs of one or more players, containing a PLAYER_NAME column
+        :param num_games: number of games to be used in rolling average
+        :return: dict of player name to df of his last raw game logs
+        """
+        games = games.sort_values(['PLAYER_NAME', 'GAME_DATE'])
+        return {player_name: player_games.reset_index(drop=True)
+                for player_name, player_games in games.groupby('PLAYER_NAME', sort=False).tail(num_games)
+                .groupby('PLAYER_NAME', sort=False)}
+
+    def create_player_datasets(self, player_names, num_games, workers=8):
+        """
+        Creates datasets for model training for many players at once and writes them to the training store. Features are
+        computed column-wise over all players together and team metrics are fetched once for the batch
+        :param player_names: players we're creating the data for
+        :param num_games: number of games to be used in rolling average
+        :param workers: number of players whose logs are fetched at once
+        :return: dict of player name to df of player data with class' features
+        """
+        raw_games = self.get_player_games(player_names, workers)
+        if raw_games.empty:
+            return {}
+        games = self.build_player_features(raw_games, num_games, self.get_opponent_metrics())
+        states = self.get_rolling_state(raw_games, num_games)
+
+        columns = ['GAME_DATE'] + self.FEATURES + self.TARGETS
+        datasets = {}
+        for player_name, player_games in games.groupby('PLAYER_NAME', sort=False):
+            games_final = player_games[columns].reset_index(drop=True)
+            self.training_store.write(games_final, self.season, player_name)
+            self.training_store.write_state(states[player_name], self.season, player_name)
+            datasets[player_name] = games_final
+        return datasets
+
+    def update_player_datasets(self, player_names, num_games, workers=8):
+        """
+        Incrementally refreshes datasets by only fetching games newer than the last one stored. The last
+        *num_games* raw rows kept in the store continue the rolling windows, so the appended rows are
+        identical to the ones a full rebuild would produce. Players without stored state are fully rebuilt
+        :param player_names: players we're refreshing the data for
+        :param num_games: number of games to be used in rolling average
+        :param workers: number of players whose logs are fetched at once
+        :return: dict of player name to df of the rows added
+        """
+        states = {}
+        rebuild = []
+        for player_name in player_names:
+            state = self.training_store.read_state(self.season, player_name)
+            if state is None or len(state) < num_games:
+                rebuild.append(player_name)
+            else:
+                states[player_name] = state.tail(num_games)
+        datasets = self.create_player_datasets(rebuild, num_games, workers) if rebuild else {}
+        if not states:
+            return datasets
+
+        last_dates = {player_name: state['GAME_DATE'].max() for player_name, state in states.items()}
+        dates_from = {player_name: (last_date + timedelta(days=1)).strftime("%m/%d/%Y")
+                      for player_name, last_date in last_dates.items()}
+        new_games = self.get_player_games(list(states), workers, dates_from)
+        if new_games.empty:
+            return datasets
+        new_games = new_games[new_games['GAME_DATE'] > new_games['PLAYER_NAME'].map(last_dates)]
+
+        raw_games = pd.concat([*states.values(), new_games], ignore_index=True)
+        games = self.build_player_features(raw_games, num_games, self.get_opponent_metrics())
+        games = games[games['GAME_DATE'] > games['PLAYER_NAME'].map(last_dates)]
+        new_states = self.get_rolling_state(raw_games, num_games)
+
+        columns = ['GAME_DATE'] + self.FEATURES + self.TARGETS
+        for player_name, player_games in games.groupby('PLAYER_NAME', sort=False):
+            games_final = player_games[columns].reset_index(drop=True)
+            self.training_store.append(games_final, self.season, player_name)
+            self.training_store.write_state(new_states[player_name], self.season, player_name)
+            datasets[player_name] = games_final
+        return datasets
 
-        columns = self.FEATURES + ['PTS']
-        games_final = games[columns]
-        games_final.to_csv("player_data/" + player_name + '.csv', index=False)
-        time.sleep(1)
-        return games_final
+    def create_player_dataset(self, player_name, num_games):
+        """
+        Creates dataset for model training and writes it to the training store
+        :param player_name is the player we're creating the data for
+        :param num_games is the number of games to be used in rolling average
+        :returns df of player data with class' features or None if some data is not available
+        """
+        return self.create_player_datasets([player_name], num_games).get(player_name)
 
     # private
     def get_event_odds(self, sport_key, event_id, markets="player_points", regions="us"):
@@ -309,16 +570,7 @@ class DataFetcher:
         :param regions
         :returns json result of query
         """
-        url = f"{self.BASE_URL}/sports/{sport_key}/events/{event_id}/odds"
-        params = {
-            "markets": markets,
-            "regions": regions,
-            "apiKey": self.ODDS_API_KEY
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Error fetching event odds: {response.status_code} {response.text}")
-        return response.json()
+        return self.odds_client.get_event_odds(sport_key, event_id, markets, regions)
 
     def get_team_estimated_metric(self, team_name):
         """
@@ -326,8 +578,8 @@ class DataFetcher:
         :param team_name: name of team to query for
         :return: df containing teams estimating metrics
         """
-        metrics_df = teamestimatedmetrics.TeamEstimatedMetrics(season=self.season).get_data_frames()[0]
-        time.sleep(1)
+        metrics_df = self.call_endpoint(teamestimatedmetrics.TeamEstimatedMetrics,
+                                        season=self.season)['TeamEstimatedMetrics']
         return metrics_df[metrics_df['TEAM_NAME'] == team_name]
 
     def get_team_players(self, team_name):
@@ -345,12 +597,8 @@ class DataFetcher:
 
         team_id = team['id']
 
-        roster = CommonTeamRoster(team_id=team_id, season=self.season)
-        players = roster.common_team_roster.get_dict()['data']
-
-        player_names = [player[3] for player in players] # Column 3 contains names
-        time.sleep(1)
-        return player_names
+        roster = self.call_endpoint(CommonTeamRoster, team_id=team_id, season=self.season)['CommonTeamRoster']
+        return roster['PLAYER'].tolist()
 
     def get_players_to_team_playing_on_date(self, date):
         """
@@ -364,9 +612,40 @@ class DataFetcher:
             players = set(self.get_team_players(team))
             for player in players:
                 player_to_team_map[player] = team
-        time.sleep(1)
         return player_to_team_map
 
+    def safe_divide(self, numerator, denominator):
+        """
+        Element-wise division that yields 0 wherever the denominator is 0
+        :param numerator: array-like of numerators
+        :param denominator: array-like of denominators
+        :return: array of quotients
+        """
+        numerator = np.asarray(numerator, dtype=float)
+        denominator = np.asarray(denominator, dtype=float)
+        return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+    def get_slate(self, date):
+        """
+        Get the slate of games on a given date. It is built once per date and reused, so its cost scales
+        with the number of teams playing rather than with the number of players queried
+        :param date: date to query for
+        :return: Slate of the date
+        """
+        # held while building so concurrent callers wait for one build instead of each fetching every roster
+        with self.slates_lock:
+            if date not in self.slates:
+                teams_playing = self.get_nba_teams_playing_on_date(date)
+                matchups = list(zip(teams_playing[::2], teams_playing[1::2]))
+                player_to_team_map = self.get_players_to_team_playing_on_date(date)
+                metrics_df = self.call_endpoint(teamestimatedmetrics.TeamEstimatedMetrics,
+                                                season=self.season)['TeamEstimatedMetrics']
+                metrics_df = metrics_df[metrics_df['TEAM_NAME'].isin(teams_playing)]
+                team_metrics = dict(zip(metrics_df['TEAM_NAME'],
+                                        zip(metrics_df['E_DEF_RATING'], metrics_df['E_PACE'])))
+                self.slates[date] = Slate(date, matchups, player_to_team_map, team_metrics)
+            return self.slates[date]
+
     def create_player_model_input(self, player_name, date, num_games=5):
         """
         Create an input for a machine learning model based on class' features
@@ -375,87 +654,87 @@ class DataFetcher:
         :param num_games: number of games to use in rolling averages
         :return: input for machinine learning model as df or None if data is not available
         """
-        teams_playing = self.get_nba_teams_playing_on_date(date)
-        home_teams = teams_playing[::2]
-        player_to_team_map = self.get_players_to_team_playing_on_date(date)
-        if player_name not in player_to_team_map:
+        slate = self.get_slate(date)
+        team = slate.get_team(player_name)
+        if team is None:
             return None
-        team = player_to_team_map[player_name]
-        input_row = {}
-        new_features = ['FORM_FGM', 'FORM_FGA', 'FORM_FG3M', 'FORM_FTM' ] + self.FEATURES
-        for stat in new_features:
-            # Calculate average
-            if "FORM" in stat:
-                split_stat = stat.split("_")
-                if split_stat[-1] != "FG2A":
-                    data = self.get_last_x_stats_in_category(player_name, stat=split_stat[-1], num_games=num_games)
-                    if data is not None:
-                        input_row[stat] = np.mean(data)
-                    else:
-                        return None
-            elif stat == "HOME":
-                input_row['HOME'] = 1 if team in home_teams else 0
-            elif "OPP" in stat:
-                index = teams_playing.index(team)
-                if index % 2 == 0:
-                    opp = teams_playing[index + 1]
-                else:
-                    opp = teams_playing[index - 1]
-                metrics_df = self.get_team_estimated_metric(opp)
-                def_rating = metrics_df['E_DEF_RATING'].iloc[0]
-                pace = metrics_df['E_PACE'].iloc[0]
-                input_row['OPP_PACE'] = pace
-                input_row['OPP_DEF_RATING'] = def_rating
-                break
-
-        logs = self.get_last_x_game_logs(player_name, num_games=1, )
-        if logs is not None:
-            logs['GAME_DATE'] = pd.to_datetime(logs['GAME_DATE'])
-            last_played = logs['GAME_DATE'].iloc[0]
-            rest = datetime.strptime(date, "%m/%d/%Y") - last_played
-            input_row['REST'] = rest.days
-        else:
+        metrics = slate.get_opponent_metrics(team)
+        if metrics is None:
             return None
-        df = pd.DataFrame([input_row])
+
+        # every FORM and REST feature is derived from a single game log fetch
+        logs = self.get_last_x_game_logs(player_name, num_games=num_games)
+        if logs is None:
+            return None
+        form = logs[self.STAT_COLUMNS].mean()
+        last_played = logs['GAME_DATE'].iloc[0]
+
+        df = pd.DataFrame([form.add_prefix('FORM_')])
+        df['HOME'] = slate.is_home(team)
+        df['REST'] = (datetime.strptime(date, "%m/%d/%Y") - last_played).days
+        def_rating, pace = metrics
+        df['OPP_DEF_RATING'] = def_rating
+        df['OPP_PACE'] = pace
         df["FORM_FG2A"] = df["FORM_FGA"] - df["FORM_FG3A"]
-        df["FORM_FG2M"] =df["FORM_FGM"] - df["FORM_FG3M"]
-        df["FG2_PCT"] = df.apply(lambda row: (row["FORM_FG2M"] / row["FORM_FG2A"]) if row["FORM_FG2A"] != 0 else 0, axis=1)
-        df["FG_PCT"] = df.apply(lambda row: (row["FORM_FGM"] / row["FORM_FGA"]) if row["FORM_FGA"] != 0 else 0, axis=1)
-        df["FG3_PCT"] = df.apply(lambda row: (row["FORM_FG3M"] / row["FORM_FG3A"]) if row["FORM_FG3A"] != 0 else 0, axis=1)
-        df["FT_PCT"] = df.apply(lambda row: (row["FORM_FTM"] / row["FORM_FTA"]) if row["FORM_FTA"] != 0 else 0, axis=1)
+        df["FORM_FG2M"] = df["FORM_FGM"] - df["FORM_FG3M"]
+        df["FG2_PCT"] = self.safe_divide(df["FORM_FG2M"], df["FORM_FG2A"])
+        df["FG3_PCT"] = self.safe_divide(df["FORM_FG3M"], df["FORM_FG3A"])
+        df["FT_PCT"] = self.safe_divide(df["FORM_FTM"], df["FORM_FTA"])
         df = df[self.FEATURES]
-        time.sleep(1)
         return df
 
+    def create_players_model_input(self, player_dates, num_games=5, workers=8):
+        """
+        Create model inputs for many players at once, players are fetched concurrently
+        :param player_dates: dict of player name to the date of his upcoming game
+        :param num_games: number of games to use in rolling averages
+        :param workers: number of players fetched at once
+        :return: df with one input row per player, indexed by player name (players without data are skipped)
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            inputs = executor.map(lambda item: self.create_player_model_input(item[0], item[1], num_games),
+                                  player_dates.items())
+            rows = {player_name: input.iloc[0] for player_name, input in zip(player_dates, inputs)
+                    if input is not None}
+        return pd.DataFrame.from_dict(rows, orient='index', columns=self.FEATURES)
+
     # private
     def fetch_player_props(self, odds, market_key="player_points"):
         """
-        Fetches all props available for players with upcoming matches from betting exchanges
+        Fetches all props available for players with upcoming matches from betting exchanges. The lines of
+        *market_key* are kept at the top level of each player's entry, the lines of every market in MARKETS
+        are kept under 'markets', keyed by stat. Only players with a *market_key* line are included
         :param odds: dict containing player odds
         :param market_key: statistical category we're interested in
         :return: dict containing players' prop information
         """
         lines = {}
+        markets = {}
+        commence_time = odds.get("commence_time")
         for bookmaker in odds.get("bookmakers", []):
             if bookmaker["key"] != "draftkings":
                 continue
             for market in bookmaker.get("markets", []):
-                if market["key"] != market_key:
+                stat = self.MARKETS.get(market["key"])
+                if market["key"] != market_key and stat is None:
                     continue
                 for outcome in market.get("outcomes", []):
                     player = outcome.get("description")
                     name = outcome.get("name").lower()  # 'over' or 'under'
-                    line = outcome.get("point")
-                    price = outcome.get("price")
-                    time = odds.get("commence_time")
-                    event_date = (datetime.strptime(time, "%Y-%m-%dT%H:%M:%SZ") - timedelta(hours=4)).strftime("%m/%d/%Y")
-                    if player not in lines:
-                        lines[player] = {}
-                        lines[player]["date"] = event_date
-                    lines[player][name] = {
-                        "line": line,
-                        "price": price
+                    prop = {
+                        "line": outcome.get("point"),
+                        "price": outcome.get("price")
                     }
+                    if market["key"] == market_key:
+                        if player not in lines:
+                            event_date = (datetime.strptime(commence_time, "%Y-%m-%dT%H:%M:%SZ") - timedelta(hours=4)).strftime("%m/%d/%Y")
+                            lines[player] = {}
+                            lines[player]["date"] = event_date
+                        lines[player][name] = prop
+                    if stat is not None:
+                        markets.setdefault(player, {}).setdefault(stat, {})[name] = prop
+        for player in lines:
+            lines[player]["markets"] = markets.get(player, {})
         return lines
 
     def update_odds_file(self):
@@ -464,13 +743,14 @@ class DataFetcher:
         """
         overall = {}
         events = self.get_upcoming_events()
-        for event in events:
-            event_id = event['id']
-            odds = self.get_event_odds(sport_key="basketball_nba", event_id=event_id)
+        # all events are fetched concurrently, results come back in event order so merging is unchanged
+        all_odds = self.odds_client.get_all_event_odds("basketball_nba", [event['id'] for event in events],
+                                                       markets=",".join(self.MARKETS))
+        for odds in all_odds:
             lines = self.fetch_player_props(odds)
             overall = overall | lines
         # Write data to the file
-        with open(self.ODDS_FILE, 'w') as json_file:
+        with open(self.odds_file, 'w') as json_file:
             json.dump(overall, json_file, indent=2)
 
     # private
@@ -479,25 +759,22 @@ class DataFetcher:
         Check the date of the last odds file update
         :return: bool indicating whether date of last update is the same as current date
         """
-        today_date = today()
-        today_date = today_date.strftime('%Y-%m-%d')
-
-        # Get the last modification time
-        last_modified_time = os.path.getmtime(self.ODDS_FILE)
-
-        last_modified_date = time.strftime('%Y-%m-%d', time.localtime(last_modified_time))
-        return last_modified_date != today_date
+        return self.odds_store.is_stale()
 
     def get_all_player_props(self):
         """
         Returns dict of all available player probs
         :return: dict of all player props in odds file
         """
-        if self.check_last_odds_file_update():
-            self.update_odds_file()
-        with open(self.ODDS_FILE, 'r') as json_file:
-            data = json.load(json_file)
-            return data
+        return self.odds_store.get_all()
+
+    def get_player_props_on_date(self, date):
+        """
+        Returns the props of every player playing on a given date
+        :param date: date of the games (%m/%d/%Y)
+        :return: dict of player name to prop information
+        """
+        return self.odds_store.get_props_for_date(date)
 
     def get_player_props(self, player_name):
         """
@@ -505,12 +782,7 @@ class DataFetcher:
         :param player_name: player to query for
         :return: dict containing player's prop information or None
         """
-        if self.check_last_odds_file_update():
-            self.update_odds_file()
-
-        with open(self.ODDS_FILE, 'r') as json_file:
-            data = json.load(json_file)
-            if player_name in data:
-                return data[player_name]
+        props = self.odds_store.get(player_name)
+        if props is None:
             print(f"{player_name} currently has no odds listed.")
-            return None
\ No newline at end of file
+        return props
\ No newline at end of file
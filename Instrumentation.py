@@ -0,0 +1,142 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+class Instrumentation:
+    ENV_VAR = "NBA_PROFILE" # set to 1 to profile every run
+    DEFAULT_REPORT_DIR = "profile_reports"
+    NULL_SPAN = nullcontext() # returned by span when disabled so the hot paths only pay an attribute check
+
+    def __init__(self, enabled=False):
+        """
+        Records timing spans and counters of a run. Spans nest per thread, so every span is reported under
+        the path of the spans that were open when it started. Disabled instances record nothing
+        :param enabled: bool indicating whether anything is recorded
+        """
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.spans = {} # span path to [calls, total seconds, child seconds]
+        self.counters = {}
+        self.started = time.time()
+
+    def enable(self):
+        """
+        Starts recording, from a clean slate
+        """
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+            self.started = time.time()
+        self.enabled = True
+
+    def span(self, name):
+        """
+        Times a block of code
+        :param name: name of the span, e.g. 'nba_api.PlayerGameLogs'
+        :return: context manager
+        """
+        if not self.enabled:
+            return self.NULL_SPAN
+        return self.record_span(name)
+
+    @contextmanager
+    def record_span(self, name):
+        """
+        :param name: name of the span
+        :return: context manager recording the span on exit
+        """
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(name)
+        path = ";".join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            with self.lock:
+                stats = self.spans.setdefault(path, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                if stack:
+                    self.spans.setdefault(";".join(stack), [0, 0.0, 0.0])[2] += elapsed
+
+    def timed(self, name):
+        """
+        Decorator recording a span around every call of a function
+        :param name: name of the span
+        :return: decorator
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.record_span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        """
+        Adds to a counter
+        :param name: name of the counter, e.g. 'api_calls'
+        :param value: amount to add
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def get_report(self):
+        """
+        :return: dict with the run's wall time, counters and spans (calls, total and self seconds per path)
+        """
+        with self.lock:
+            spans = {path: {'calls': calls, 'total_seconds': total, 'self_seconds': max(total - children, 0.0)}
+                     for path, (calls, total, children) in self.spans.items()}
+            return {
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'wall_seconds': time.time() - self.started,
+                'counters': dict(self.counters),
+                'spans': dict(sorted(spans.items(), key=lambda item: -item[1]['total_seconds']))
+            }
+
+    def write_report(self, directory=DEFAULT_REPORT_DIR, name="run"):
+        """
+        Writes the report as json and as collapsed stacks ('a;b;c <microseconds>' per line), the format
+        read by flamegraph.pl and speedscope
+        :param directory: directory the reports are written to
+        :param name: prefix of the report files, a timestamp is appended
+        :return: path of the json report
+        """
+        report = self.get_report()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}")
+        with open(path + ".json", 'w') as f:
+            json.dump(report, f, indent=2)
+        with open(path + ".folded", 'w') as f:
+            for span_path, stats in report['spans'].items():
+                f.write(f"{span_path} {round(stats['self_seconds'] * 1e6)}\n")
+        return path + ".json"
+
+    def print_summary(self, top=15):
+        """
+        Prints the counters and the spans with the most total time
+        :param top: number of spans to print
+        """
+        report = self.get_report()
+        print(f"Run took {report['wall_seconds']:.2f}s")
+        for name, value in sorted(report['counters'].items()):
+            print(f"  {name:<28} {value:,.2f}" if isinstance(value, float) else f"  {name:<28} {value:,}")
+        for path, stats in list(report['spans'].items())[:top]:
+            print(f"  {stats['total_seconds']:>9.3f}s {stats['self_seconds']:>9.3f}s self {stats['calls']:>7}x  {path}")
+
+# shared by every module so one run produces one report
+profiler = Instrumentation(os.getenv(Instrumentation.ENV_VAR) == "1")
@@ -0,0 +1,241 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from Instrumentation import profiler
+
+class Ledger:
+    DATE_FORMAT = "%m/%d/%Y" # format used by the rest of the project, dates are stored as ISO so they sort
+
+    def __init__(self, path):
+        """
+        SQLite storage of the portfolio. Bets and their settlements are append-only tables with one bet
+        per player/date/market, every write happens in a transaction
+        :param path: database file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS players ("
+                "name TEXT PRIMARY KEY);"
+                "CREATE TABLE IF NOT EXISTS bets ("
+                "id INTEGER PRIMARY KEY, "
+                "player TEXT NOT NULL, "
+                "date TEXT NOT NULL, "
+                "market TEXT NOT NULL, "
+                "line REAL NOT NULL, "
+                "predicted REAL, "
+                "ev REAL, "
+                "UNIQUE (player, date, market));"
+                "CREATE INDEX IF NOT EXISTS bets_date ON bets (date);"
+                "CREATE TABLE IF NOT EXISTS settlements ("
+                "bet_id INTEGER PRIMARY KEY REFERENCES bets (id), "
+                "actual REAL, " # null for a void bet
+                "settled_at TEXT NOT NULL);"
+            )
+
+    def connect(self):
+        """
+        Opens a new connection, one is opened per operation so the ledger can be shared between threads
+        :return: sqlite3 connection
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def to_iso(self, date):
+        """
+        :param date: date in DATE_FORMAT
+        :return: date as YYYY-MM-DD
+        """
+        return datetime.strptime(date, self.DATE_FORMAT).strftime("%Y-%m-%d")
+
+    def from_iso(self, date):
+        """
+        :param date: date as YYYY-MM-DD
+        :return: date in DATE_FORMAT
+        """
+        return datetime.strptime(date, "%Y-%m-%d").strftime(self.DATE_FORMAT)
+
+    def to_bet(self, row):
+        """
+        :param row: row of the bets table joined with its settlement
+        :return: bet as a dict, with the date in DATE_FORMAT
+        """
+        bet = dict(row)
+        bet['date'] = self.from_iso(bet['date'])
+        return bet
+
+    def add_player(self, player_name):
+        """
+        Adds a player to the portfolio
+        :param player_name: player to add
+        """
+        with closing(self.connect()) as conn, conn:
+            conn.execute("INSERT OR IGNORE INTO players (name) VALUES (?)", (player_name,))
+
+    def remove_player(self, player_name):
+        """
+        Removes a player from the portfolio, his betting history is kept
+        :param player_name: player to remove
+        """
+        with closing(self.connect()) as conn, conn:
+            conn.execute("DELETE FROM players WHERE name = ?", (player_name,))
+
+    def get_players(self):
+        """
+        :return: list of players in the portfolio
+        """
+        with closing(self.connect()) as conn:
+            return [row['name'] for row in conn.execute("SELECT name FROM players ORDER BY rowid")]
+
+    @profiler.timed("ledger.record_bets")
+    def record_bets(self, bets):
+        """
+        Records new bets in a single transaction, a bet already recorded for the same player/date/market
+        is left untouched
+        :param bets: list of dicts with player, date, market, line, predicted and ev
+        """
+        rows = [(bet['player'], self.to_iso(bet['date']), bet['market'], bet['line'], bet['predicted'], bet['ev'])
+                for bet in bets]
+        with closing(self.connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO bets (player, date, market, line, predicted, ev) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    @profiler.timed("ledger.settle_bets")
+    def settle_bets(self, results):
+        """
+        Settles bets in a single transaction
+        :param results: dict of bet id to actual stat, None voids the bet
+        """
+        settled_at = datetime.now().isoformat(timespec='seconds')
+        with closing(self.connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO settlements (bet_id, actual, settled_at) VALUES (?, ?, ?)",
+                [(bet_id, actual, settled_at) for bet_id, actual in results.items()]
+            )
+
+    @profiler.timed("ledger.get_last_bet")
+    def get_last_bet(self, player_name, market):
+        """
+        :param player_name: player
+        :param market: statistical category
+        :return: player's most recent bet as a dict (settled is 0 or 1) or None
+        """
+        with closing(self.connect()) as conn:
+            row = conn.execute(
+                "SELECT b.*, s.actual, s.bet_id IS NOT NULL AS settled FROM bets b "
+                "LEFT JOIN settlements s ON s.bet_id = b.id "
+                "WHERE b.player = ? AND b.market = ? ORDER BY b.date DESC LIMIT 1",
+                (player_name, market)
+            ).fetchone()
+        return self.to_bet(row) if row is not None else None
+
+    @profiler.timed("ledger.get_last_bets")
+    def get_last_bets(self, market):
+        """
+        :param market: statistical category
+        :return: dict of player name to his most recent bet
+        """
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                "SELECT b.*, s.actual, s.bet_id IS NOT NULL AS settled FROM bets b "
+                "LEFT JOIN settlements s ON s.bet_id = b.id "
+                "WHERE b.market = ? AND b.date = (SELECT MAX(date) FROM bets WHERE player = b.player AND market = ?)",
+                (market, market)
+            ).fetchall()
+        return {row['player']: self.to_bet(row) for row in rows}
+
+    @profiler.timed("ledger.get_pending_bets")
+    def get_pending_bets(self, before_date, market=None):
+        """
+        :param before_date: only bets on games played before this date are returned
+        :param market: only return bets of this statistical category, all categories if None
+        :return: list of unsettled bets as dicts
+        """
+        query = ("SELECT b.* FROM bets b LEFT JOIN settlements s ON s.bet_id = b.id "
+                 "WHERE s.bet_id IS NULL AND b.date < ?")
+        params = [self.to_iso(before_date)]
+        if market is not None:
+            query += " AND b.market = ?"
+            params.append(market)
+        with closing(self.connect()) as conn:
+            return [self.to_bet(row) for row in conn.execute(query, params)]
+
+    @profiler.timed("ledger.get_history")
+    def get_history(self, player_name=None, market=None):
+        """
+        :param player_name: only return bets of this player, all players if None
+        :param market: only return bets of this statistical category, all categories if None
+        :return: list of bets as dicts, oldest first, with actual set once settled
+        """
+        query = ("SELECT b.*, s.actual, s.bet_id IS NOT NULL AS settled FROM bets b "
+                 "LEFT JOIN settlements s ON s.bet_id = b.id WHERE 1 = 1")
+        params = []
+        if player_name is not None:
+            query += " AND b.player = ?"
+            params.append(player_name)
+        if market is not None:
+            query += " AND b.market = ?"
+            params.append(market)
+        with closing(self.connect()) as conn:
+            return [self.to_bet(row) for row in conn.execute(query + " ORDER BY b.date, b.id", params)]
+
+    @profiler.timed("ledger.migrate_from_json")
+    def migrate_from_json(self, filename, market='PTS', known_players=None):
+        """
+        One-time import of the old json portfolio. Nothing is imported if the ledger already has players
+        :param filename: json portfolio file
+        :param market: statistical category the json predictions were made for
+        :param known_players: player names used to split keys that merged two of them
+        :return: bool indicating whether anything was imported
+        """
+        if self.get_players() or not os.path.exists(filename):
+            return False
+        with open(filename, 'r') as f:
+            content = f.read().strip()
+        players = json.loads(content) if content else {}
+
+        settled_at = datetime.now().isoformat(timespec='seconds')
+        with closing(self.connect()) as conn, conn:
+            for player_name, history in players.items():
+                merged = self.split_merged_name(player_name, known_players or [])
+                if merged is not None:
+                    # no player is found under a merged name, so it never had bets of its own
+                    conn.executemany("INSERT OR IGNORE INTO players (name) VALUES (?)", [(name,) for name in merged])
+                    if history['date']:
+                        print(f"Skipped {len(history['date'])} bets of {player_name}, they can't be attributed.")
+                    continue
+                conn.execute("INSERT OR IGNORE INTO players (name) VALUES (?)", (player_name,))
+                for i, date in enumerate(history['date']):
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO bets (player, date, market, line, predicted, ev) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (player_name, self.to_iso(date), market, history['line'][i],
+                         history['predicted'][i], history['ev'][i])
+                    )
+                    # actual results were appended in the same order as the bets they settle
+                    if i < len(history['actual']) and cursor.rowcount:
+                        conn.execute("INSERT INTO settlements (bet_id, actual, settled_at) VALUES (?, ?, ?)",
+                                     (cursor.lastrowid, history['actual'][i], settled_at))
+        return True
+
+    def split_merged_name(self, player_name, known_players):
+        """
+        Old portfolios missed a comma in their player list, which merged two names into one key
+        :param player_name: key of the json portfolio
+        :param known_players: player names the key may be made of
+        :return: list of the two names merged into *player_name*, None if it isn't a merged key
+        """
+        if player_name in known_players:
+            return None
+        for first in known_players:
+            if player_name.startswith(first) and player_name[len(first):] in known_players:
+                return [first, player_name[len(first):]]
+        return None
@@ -1,14 +1,28 @@
 import numpy as np
+import json
+import os
 from catboost import CatBoostRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error
+from scipy.stats import norm, qmc
+from Instrumentation import profiler
 
 class Model:
-    def __init__(self, features, test_size=0.2, random_state=42):
+    ARTIFACT_VERSION = 2
+    DEFAULT_ARTIFACT_DIR = "model_artifacts"
+    TUNED_PARAMS_FILE = os.path.join(DEFAULT_ARTIFACT_DIR, "best_params.json") # written by Tuner.save_best
+
+    def __init__(self, features, test_size=0.2, random_state=42, params=None):
+        """
+        :param features: feature columns
+        :param test_size: fraction of the data held out to measure the error
+        :param random_state: seed of the split and of CatBoost
+        :param params: CatBoost settings overriding the defaults, e.g. {'depth': 8, 'thread_count': 2}
+        """
         self.features = features
         self.test_size = test_size
         self.random_state = random_state
-        self.model = CatBoostRegressor(
+        self.params = dict(
             iterations=300,
             learning_rate=0.04,
             depth=6,
@@ -17,9 +31,35 @@ class Model:
             random_seed=self.random_state,
             verbose=0
         )
+        self.params.update(params or {})
+        self.model = CatBoostRegressor(**self.params)
         self.mae = None
         self.stds = {}
+        self.residuals = None
+        self.target_col = None
+        self.fingerprint = None
+        self.saved_params = None
+
+    def use_tuned_params(self, target_col='PTS', path=TUNED_PARAMS_FILE):
+        """
+        Overrides the CatBoost settings with the best ones found by the Tuner, if any were saved for the
+        same target
+        :param target_col: column the model will predict
+        :param path: json file written by Tuner.save_best
+        :return: bool indicating whether tuned settings were applied
+        """
+        if not os.path.exists(path):
+            return False
+        with open(path, 'r') as f:
+            tuned = json.load(f)
+        if tuned['target_col'] != target_col:
+            print(f"Tuned settings in {path} are for {tuned['target_col']}, not {target_col}, using the defaults.")
+            return False
+        self.params.update(tuned['params'])
+        self.model = CatBoostRegressor(**self.params)
+        return True
 
+    @profiler.timed("model.train")
     def train(self, df, target_col='PTS'):
         """
         Train the model
@@ -34,14 +74,25 @@ class Model:
             X, y, test_size=self.test_size, random_state=self.random_state
         )
 
+        self.target_col = target_col
         self.model.fit(X_train, y_train)
         y_pred = self.model.predict(X_test)
         self.mae = mean_absolute_error(y_test, y_pred)
+        # sorted holdout residuals form the empirical distribution of actual - predicted
+        self.residuals = np.sort(np.asarray(y_test, dtype=float) - y_pred)
+        self.set_feature_stds(df, X_train)
+        return self.mae
+
+    def set_feature_stds(self, df, X_train):
+        """
+        Stores the std of every non-binary feature, used as the noise scale when simulating
+        :param df: dataframe used for training
+        :param X_train: training split of the features
+        """
         binary_features = self.get_binary_features(df)
         numeric_features = [f for f in self.features if f not in binary_features]
         for feature in numeric_features:
             self.stds[feature] = X_train[feature].std()
-        return self.mae
 
     def predict(self, row_df):
         """
@@ -49,7 +100,9 @@ class Model:
         :param row_df: row to perform prediction with
         :return: prediction
         """
-        prediction = self.model.predict(row_df[self.features])
+        with profiler.span("model.predict"):
+            prediction = self.model.predict(row_df[self.features])
+        profiler.count('predict_rows', len(row_df))
         return prediction
 
     def is_binary(self, series):
@@ -70,6 +123,7 @@ class Model:
         binary_features = [col for col in self.features if self.is_binary(df[col])]
         return binary_features
 
+    @profiler.timed("model.simulate")
     def simulate(self, row_df, constant_features=[], n = 100):
         """
         Perform a monte carlo simulation by making n predictions where varying levels of noise is added
@@ -87,5 +141,208 @@ class Model:
                     std = self.stds[feature]
                     noisy_input[feature] += np.random.normal(0, std)
             pred = self.model.predict(noisy_input)
+            profiler.count('predict_rows', len(noisy_input))
             simulations.append(pred)
-        return simulations
\ No newline at end of file
+        return simulations
+
+    def simulate_batch(self, row_df, constant_features=[], n=100, rng=None):
+        """
+        Perform a monte carlo simulation in a single batch. The noise for all n draws is built as one
+        n x features matrix and scored with a single predict call
+        :param row_df: single row input (must match feature names)
+        :param constant_features: features we do not want to add noise to
+        :param n: number of simulations
+        :param rng: numpy random Generator, pass a seeded one for reproducible simulations
+        :return: flat array of n predictions
+        """
+        return self.simulate_slate(row_df.iloc[:1], constant_features, n, rng)[0]
+
+    @profiler.timed("model.simulate_slate")
+    def simulate_slate(self, rows_df, constant_features=[], n=100, rng=None):
+        """
+        Perform n simulations for every row of *rows_df* at once. All rows are stacked into a single
+        (rows * n) x features matrix and scored with one predict call
+        :param rows_df: one input row per player (must match feature names)
+        :param constant_features: features we do not want to add noise to
+        :param n: number of simulations per row
+        :param rng: numpy random Generator, pass a seeded one for reproducible simulations
+        :return: array of shape (rows, n) with the predictions of each row, (rows, n, targets) for multi-target models
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        base = rows_df[self.features].to_numpy(dtype=float)
+        num_rows = len(base)
+        inputs = np.repeat(base, n, axis=0)
+        noisy_columns, stds = self.get_noise_columns(constant_features)
+        if noisy_columns:
+            inputs[:, noisy_columns] += rng.normal(0, 1, size=(num_rows * n, len(noisy_columns))) * stds
+        predictions = np.asarray(self.model.predict(inputs))
+        profiler.count('predict_rows', len(inputs))
+        # multi-target models predict one column per target, which is kept as the last axis
+        return predictions.reshape(num_rows, n, *predictions.shape[1:])
+
+    @profiler.timed("model.simulate_adaptive")
+    def simulate_adaptive(self, row_df, line, constant_features=[], certainty_line=0.9, tolerance=0.01,
+                          block_size=256, max_draws=10000, sampler='antithetic', confidence=0.95, rng=None):
+        """
+        Estimate P(prediction > line) by drawing blocks of simulations until the confidence interval is
+        narrower than *tolerance* or clearly on one side of the certainty thresholds, so clear-cut players
+        stop early and the draw budget goes to the marginal ones
+        :param row_df: single row input (must match feature names)
+        :param line: betting line
+        :param constant_features: features we do not want to add noise to
+        :param certainty_line: probability an outcome needs before it is bet on
+        :param tolerance: stop once the half width of the confidence interval is below this
+        :param block_size: draws per block, a power of 2 when using sobol
+        :param max_draws: max number of draws, at least 2
+        :param sampler: 'antithetic' for mirrored normal draws, 'sobol' for scrambled quasi-random draws
+        :param confidence: confidence level of the interval
+        :param rng: numpy random Generator, pass a seeded one for reproducible simulations
+        :return: dict with p_over, ci_low, ci_high and the number of draws used
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        base = row_df[self.features].to_numpy(dtype=float)[0]
+        noisy_columns, stds = self.get_noise_columns(constant_features)
+        if not noisy_columns:
+            p_over = float(self.model.predict(base[None, :])[0] > line)
+            return {'p_over': p_over, 'ci_low': p_over, 'ci_high': p_over, 'draws': 1}
+
+        if max_draws < 2:
+            raise Exception(f"max_draws must be at least 2, got {max_draws}.")
+        z_crit = norm.ppf(0.5 + confidence / 2)
+        # independent replicates of the estimate: antithetic pairs, or whole blocks for sobol
+        replicates = []
+        hit_count = 0
+        draws = 0
+        while draws < max_draws:
+            # the last block only spends what is left of the budget
+            size = min(block_size, max_draws - draws)
+            if sampler == 'sobol':
+                # sobol points are only balanced in blocks of a power of 2
+                size = 1 << (size.bit_length() - 1)
+                uniforms = qmc.Sobol(d=len(noisy_columns), scramble=True, seed=rng).random(size)
+                noise = norm.ppf(uniforms) * stds
+            else:
+                if size < 2:
+                    break
+                half = rng.normal(0, 1, size=(size // 2, len(noisy_columns))) * stds
+                noise = np.vstack([half, -half])
+            inputs = np.tile(base, (len(noise), 1))
+            inputs[:, noisy_columns] += noise
+            hits = np.asarray(self.model.predict(inputs)).ravel() > line
+            profiler.count('predict_rows', len(inputs))
+            if sampler == 'sobol':
+                replicates.append(hits.mean())
+            else:
+                replicates.extend((hits[:len(half)] + hits[len(half):]) / 2)
+            hit_count += int(hits.sum())
+            draws += len(noise)
+
+            p_over, ci_low, ci_high = self.get_confidence_interval(replicates, hit_count, draws, z_crit)
+            if len(replicates) < 2:
+                continue
+            bet_decided = ci_low > certainty_line or ci_high < 1 - certainty_line
+            no_bet_decided = ci_high < certainty_line and ci_low > 1 - certainty_line
+            if (ci_high - ci_low) / 2 < tolerance or bet_decided or no_bet_decided:
+                break
+
+        return {'p_over': p_over, 'ci_low': ci_low, 'ci_high': ci_high, 'draws': draws}
+
+    def get_confidence_interval(self, replicates, hit_count, draws, z_crit):
+        """
+        Wilson score interval of the probability of the over. The number of draws is replaced by the
+        effective sample size measured from the replicates, so the interval keeps the sampler's variance
+        reduction. When every replicate agrees their spread is zero, the interval then uses the plain number of
+        draws instead of collapsing to a point
+        :param replicates: independent estimates of the probability
+        :param hit_count: number of draws over the line
+        :param draws: number of draws
+        :param z_crit: critical value of the confidence level
+        :return: tuple of the probability of the over and the low and high end of its interval
+        """
+        p_over = hit_count / draws
+        variance = np.var(replicates, ddof=1) / len(replicates) if len(replicates) > 1 else 0.0
+        n = p_over * (1 - p_over) / variance if variance > 0 else draws
+        denominator = 1 + z_crit ** 2 / n
+        center = (p_over + z_crit ** 2 / (2 * n)) / denominator
+        half_width = z_crit * np.sqrt(p_over * (1 - p_over) / n + z_crit ** 2 / (4 * n ** 2)) / denominator
+        return float(p_over), float(max(center - half_width, 0.0)), float(min(center + half_width, 1.0))
+
+    def get_noise_columns(self, constant_features=[]):
+        """
+        Finds the feature columns that receive noise during a simulation, binary features have no std
+        and are therefore never perturbed
+        :param constant_features: features we do not want to add noise to
+        :return: list of column positions in self.features and array of their stds
+        """
+        columns = [i for i, feature in enumerate(self.features)
+                   if feature in self.stds and feature not in constant_features]
+        stds = np.array([self.stds[self.features[i]] for i in columns], dtype=float)
+        return columns, stds
+
+    def save(self, path=None, fingerprint=None):
+        """
+        Saves the trained model as a versioned artifact: the CatBoost model plus a json file holding
+        everything else needed to predict and simulate
+        :param path: directory to save the artifact in, defaults to DEFAULT_ARTIFACT_DIR
+        :param fingerprint: fingerprint of the data the model was trained on
+        """
+        path = path or self.DEFAULT_ARTIFACT_DIR
+        os.makedirs(path, exist_ok=True)
+        self.model.save_model(os.path.join(path, "model.cbm"))
+        metadata = {
+            "version": self.ARTIFACT_VERSION,
+            "features": self.features,
+            "target_col": self.target_col,
+            "params": self.params,
+            "stds": {feature: float(std) for feature, std in self.stds.items()},
+            "mae": float(self.mae),
+            "residuals": self.residuals.tolist(),
+            "fingerprint": fingerprint
+        }
+        with open(os.path.join(path, "model.json"), 'w') as f:
+            json.dump(metadata, f, indent=4)
+        self.fingerprint = fingerprint
+
+    def load(self, path=None):
+        """
+        Loads an artifact written by save
+        :param path: directory of the artifact, defaults to DEFAULT_ARTIFACT_DIR
+        :return: bool indicating whether a compatible artifact was loaded
+        """
+        path = path or self.DEFAULT_ARTIFACT_DIR
+        metadata_file = os.path.join(path, "model.json")
+        if not os.path.exists(metadata_file):
+            return False
+        with open(metadata_file, 'r') as f:
+            metadata = json.load(f)
+        if metadata["version"] != self.ARTIFACT_VERSION or metadata["features"] != self.features:
+            return False
+        self.model.load_model(os.path.join(path, "model.cbm"))
+        self.target_col = metadata["target_col"]
+        self.stds = metadata["stds"]
+        self.mae = metadata["mae"]
+        self.residuals = np.array(metadata["residuals"])
+        self.fingerprint = metadata["fingerprint"]
+        self.saved_params = metadata["params"]
+        return True
+
+    def load_or_train(self, fingerprint, load_df, target_col='PTS', path=None):
+        """
+        Loads the saved model if it was trained on the same data with the same settings, otherwise trains
+        a new one and saves it
+        :param fingerprint: fingerprint of the current training data
+        :param load_df: function returning the training dataframe, only called if training is needed
+        :param target_col: column we'd like to predict
+        :param path: directory of the artifact, defaults to DEFAULT_ARTIFACT_DIR
+        :return: bool indicating whether the model was retrained and saved
+        """
+        if (self.load(path) and self.fingerprint == fingerprint and self.target_col == target_col
+                and self.saved_params == self.params):
+            return False
+        self.model = CatBoostRegressor(**self.params)
+        if self.train(load_df(), target_col) is None:
+            return False
+        self.save(path, fingerprint)
+        return True
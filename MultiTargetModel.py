@@ -0,0 +1,123 @@
+import numpy as np
+from catboost import CatBoostRegressor
+from sklearn.model_selection import train_test_split
+from Model import Model
+from Instrumentation import profiler
+
+class MultiTargetModel(Model):
+    DEFAULT_ARTIFACT_DIR = "model_artifacts/multi"
+    DEFAULT_TARGETS = ['PTS', 'REB', 'AST', 'FG3M']
+    # markets settled on a sum of targets, priced from the sum of their simulated outcomes
+    DERIVED_TARGETS = {'PRA': ['PTS', 'REB', 'AST']}
+
+    def __init__(self, features, targets=DEFAULT_TARGETS, test_size=0.2, random_state=42, params=None):
+        """
+        Model predicting several stats at once with a single multi-output CatBoost model, so every market
+        of a player is priced from one predict call and the stats stay consistent with each other
+        :param features: feature columns
+        :param targets: stats to predict
+        :param test_size: fraction of the data held out to measure the error
+        :param random_state: seed of the split and of CatBoost
+        :param params: CatBoost settings overriding the defaults
+        """
+        super().__init__(features, test_size, random_state, params)
+        self.targets = list(targets)
+        self.params['loss_function'] = 'MultiRMSE'
+        self.model = CatBoostRegressor(**self.params)
+
+    def use_tuned_params(self, target_col=None, path=Model.TUNED_PARAMS_FILE):
+        """
+        The Tuner searches the settings of a single target with an MAE objective, they are never applied to
+        the MultiRMSE model
+        :param target_col: columns the model will predict
+        :param path: json file written by Tuner.save_best
+        :return: False, the defaults are kept
+        """
+        return False
+
+    @profiler.timed("model.train")
+    def train(self, df, target_col=None):
+        """
+        Train the model on every target at once, rows missing any target are skipped
+        :param df: dataframe to use for training
+        :param target_col: columns we'd like to predict, defaults to the model's targets
+        :return: mean absolute error of trained model, averaged over the targets, or None if no row has every target
+        """
+        targets = list(target_col or self.targets)
+        df = df.dropna(subset=targets)
+        if df.empty:
+            # rows imported from the old csv files only have points
+            print(f"No training rows have every target ({', '.join(targets)}), run refresh to rebuild the datasets.")
+            return None
+        X = df[self.features]
+        y = df[targets]
+
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=self.test_size, random_state=self.random_state
+        )
+
+        self.targets = targets
+        self.target_col = targets
+        self.model.fit(X_train, y_train)
+        y_pred = np.asarray(self.model.predict(X_test))
+        # residuals are sorted per target, one column each
+        self.residuals = np.sort(np.asarray(y_test, dtype=float) - y_pred, axis=0)
+        self.mae = float(np.abs(self.residuals).mean())
+        self.set_feature_stds(df, X_train)
+        return self.mae
+
+    def get_maes(self):
+        """
+        :return: dict of target to its mean absolute error on the holdout set
+        """
+        return {target: float(np.abs(self.residuals[:, i]).mean()) for i, target in enumerate(self.targets)}
+
+    def get_residuals(self, stat):
+        """
+        :param stat: target or derived target
+        :return: sorted holdout residuals of the stat
+        """
+        if stat in self.DERIVED_TARGETS:
+            # residuals are sorted per column, their sum is not the residual of the derived target
+            raise Exception(f"No residuals are kept for derived target {stat}, use simulate_markets instead.")
+        return self.residuals[:, self.targets.index(stat)]
+
+    def load(self, path=None):
+        """
+        Loads an artifact written by save
+        :param path: directory of the artifact, defaults to DEFAULT_ARTIFACT_DIR
+        :return: bool indicating whether a compatible artifact was loaded
+        """
+        if not super().load(path):
+            return False
+        self.targets = list(self.target_col)
+        return True
+
+    def load_or_train(self, fingerprint, load_df, target_col=None, path=None):
+        """
+        Loads the saved model if it was trained on the same data with the same settings, otherwise trains
+        a new one and saves it
+        :param fingerprint: fingerprint of the current training data
+        :param load_df: function returning the training dataframe, only called if training is needed
+        :param target_col: columns we'd like to predict, defaults to the model's targets
+        :param path: directory of the artifact, defaults to DEFAULT_ARTIFACT_DIR
+        :return: bool indicating whether the model was retrained
+        """
+        return super().load_or_train(fingerprint, load_df, list(target_col or self.targets), path)
+
+    def simulate_markets(self, rows_df, constant_features=[], n=100, rng=None):
+        """
+        Perform a monte carlo simulation of every target for every row with a single predict call,
+        derived targets are the sum of their components within each draw
+        :param rows_df: one input row per player (must match feature names)
+        :param constant_features: features we do not want to add noise to
+        :param n: number of simulations per row
+        :param rng: numpy random Generator, pass a seeded one for reproducible simulations
+        :return: dict of stat to array of shape (rows, n)
+        """
+        predictions = self.simulate_slate(rows_df, constant_features, n, rng)
+        outcomes = {target: predictions[:, :, i] for i, target in enumerate(self.targets)}
+        for stat, components in self.DERIVED_TARGETS.items():
+            if all(component in outcomes for component in components):
+                outcomes[stat] = sum(outcomes[component] for component in components)
+        return outcomes
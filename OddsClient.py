@@ -0,0 +1,99 @@
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from RateLimiter import RateLimitError
+from Instrumentation import profiler
+from Transport import Transport
+
+class OddsClient:
+    BASE_URL = "https://api.the-odds-api.com/v4"
+    DEFAULT_MAX_CONCURRENCY = 8
+    DEFAULT_TIMEOUT = 10
+
+    def __init__(self, api_key, base_url=BASE_URL, max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 transport=None):
+        """
+        Client for the Odds API. Requests share one pooled session so connections are kept alive
+        between calls instead of paying a new TCP/TLS handshake each time
+        :param api_key: Odds API key
+        :param base_url: root url of the api, can point to a local stub server
+        :param max_concurrency: max number of requests in flight at once
+        :param timeout: seconds to wait for a response
+        :param transport: Transport recording or replaying the responses, requests are sent as usual if None
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.transport = transport if transport is not None else Transport()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path, params):
+        """
+        Sends a GET request to the api through the transport
+        :param path: path relative to the base url
+        :param params: query parameters, the api key is added automatically
+        :return: json result of query
+        """
+        # the api key is left out of the transport's key so it never ends up in a fixture archive
+        return self.transport.fetch('odds_api', path, params, lambda: self.send(path, params))
+
+    def send(self, path, params):
+        """
+        Sends a GET request to the api
+        :param path: path relative to the base url
+        :param params: query parameters, the api key is added automatically
+        :return: json result of query
+        """
+        with profiler.span("odds_api.get"):
+            response = self.session.get(f"{self.base_url}{path}", params=params | {"apiKey": self.api_key},
+                                        timeout=self.timeout)
+        profiler.count('odds_api_calls')
+        profiler.count('odds_api_bytes', len(response.content))
+        if response.status_code == 429:
+            raise RateLimitError(f"Rate limited fetching {path}: {response.text}")
+        if response.status_code != 200:
+            raise Exception(f"Error fetching {path}: {response.status_code} {response.text}")
+        return response.json()
+
+    def get_upcoming_events(self, sport_key="basketball_nba", regions="us"):
+        """
+        Fetch upcoming events for a given sport
+        :param sport_key: sport we're interested in
+        :param regions: regions of the bookmakers
+        :return: json result of query
+        """
+        return self.get(f"/sports/{sport_key}/events", {"regions": regions})
+
+    def get_event_odds(self, sport_key, event_id, markets="player_points", regions="us"):
+        """
+        Fetches odds for a specific event, including player props
+        :param sport_key: sport we're interested in
+        :param event_id: id of the event we're querying
+        :param markets: statistical categories
+        :param regions: regions of the bookmakers
+        :return: json result of query
+        """
+        return self.get(f"/sports/{sport_key}/events/{event_id}/odds", {"markets": markets, "regions": regions})
+
+    def get_all_event_odds(self, sport_key, event_ids, markets="player_points", regions="us"):
+        """
+        Fetches the odds of many events at once, at most max_concurrency requests are in flight
+        :param sport_key: sport we're interested in
+        :param event_ids: ids of the events we're querying
+        :param markets: statistical categories
+        :param regions: regions of the bookmakers
+        :return: list of json results, in the same order as *event_ids*
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(lambda event_id: self.get_event_odds(sport_key, event_id, markets, regions),
+                                     event_ids))
+
+    def close(self):
+        """
+        Closes the pooled connections
+        """
+        self.session.close()
@@ -0,0 +1,81 @@
+from dateutil.utils import today
+import json
+import os
+import time
+
+class OddsStore:
+    def __init__(self, filename, refresh=None, force_refresh=False):
+        """
+        In-memory index of the odds file. The file is parsed once and only reloaded when its
+        modification time changes
+        :param filename: odds file to index
+        :param refresh: function rewriting the odds file, called when the file wasn't updated today
+        :param force_refresh: refresh on first use even if the file was updated today
+        """
+        self.filename = filename
+        self.refresh = refresh
+        self.force_refresh = force_refresh
+        self.props = {}
+        self.props_by_date = {}
+        self.loaded_mtime = None
+        self.checked_date = None
+
+    def is_stale(self):
+        """
+        Check the date of the last odds file update
+        :return: bool indicating whether the file is missing or wasn't updated today
+        """
+        if not os.path.exists(self.filename):
+            return True
+        today_date = today().strftime('%Y-%m-%d')
+        last_modified_date = time.strftime('%Y-%m-%d', time.localtime(os.path.getmtime(self.filename)))
+        return last_modified_date != today_date
+
+    def ensure_fresh(self):
+        """
+        Applies the refresh policy once per day and reloads the index if the file changed since it was loaded
+        """
+        today_date = today().strftime('%Y-%m-%d')
+        if self.checked_date != today_date:
+            self.checked_date = today_date
+            if self.refresh is not None and (self.force_refresh or self.is_stale()):
+                self.force_refresh = False
+                self.refresh()
+        mtime = os.path.getmtime(self.filename)
+        if mtime != self.loaded_mtime:
+            self.load(mtime)
+
+    def load(self, mtime):
+        """
+        Parses the odds file and rebuilds the indexes
+        :param mtime: modification time of the file being loaded
+        """
+        with open(self.filename, 'r') as json_file:
+            self.props = json.load(json_file)
+        self.props_by_date = {}
+        for player, info in self.props.items():
+            self.props_by_date.setdefault(info['date'], {})[player] = info
+        self.loaded_mtime = mtime
+
+    def get(self, player_name):
+        """
+        :param player_name: player to query for
+        :return: dict containing player's prop information or None
+        """
+        self.ensure_fresh()
+        return self.props.get(player_name)
+
+    def get_all(self):
+        """
+        :return: dict of all player props, keyed by player name
+        """
+        self.ensure_fresh()
+        return self.props
+
+    def get_props_for_date(self, date):
+        """
+        :param date: date of the games (%m/%d/%Y)
+        :return: dict of player name to prop information for every player playing on *date*
+        """
+        self.ensure_fresh()
+        return self.props_by_date.get(date, {})
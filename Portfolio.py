@@ -1,5 +1,9 @@
-from dateutil.utils import today
-import json
+from datetime import datetime
+from Ledger import Ledger
+from Instrumentation import profiler
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
 
 class Portfolio:
     DEFAULT_CUTOFF = '01/01/2025'
@@ -49,111 +53,76 @@ class Portfolio:
         "Jalen Brunson",
         "Karl-Anthony Towns",
         "Myles Turner",
-        "Donovan Mitchell"
+        "Donovan Mitchell",
         "Evan Mobley",
         "Kawhi Leonard",
         "Jalen Green",
         "Anthony Edwards"
     ]
 
-    def __init__(self, filename, data_fetcher, calculator, model):
-        self.players = {}
+    def __init__(self, filename, data_fetcher, calculator, model, legacy_filename=None):
+        """
+        :param filename: sqlite ledger holding the portfolio
+        :param data_fetcher: data fetcher
+        :param calculator: calculator
+        :param model: trained model
+        :param legacy_filename: old json portfolio, imported once into an empty ledger
+        """
         self.fetcher = data_fetcher
         self.calculator = calculator
         self.filename = filename
-        self.load(filename)
+        self.ledger = Ledger(filename)
+        if legacy_filename is not None:
+            self.ledger.migrate_from_json(legacy_filename, known_players=self.INITIAL_PORTFOLIO)
         self.model = model
 
-    def load(self, filename):
-        """
-        Loads the json in the given file into the player dictionary
-        :param filename: file to load from
-        """
-        try:
-            with open(filename, 'r') as f:
-                # Check if the file is empty
-                if f.read().strip():  # File contains data
-                    f.seek(0)  # Move the cursor back to the start of the file
-                    self.players = json.load(f)
-                else:
-                    self.players = {}  # Handle the empty file case
-        except FileNotFoundError:
-            self.players = {}  # Handle the case where the file doesn't exist
-            self.save(self.players)
-
-    def save(self, filename):
+    @property
+    def players(self):
         """
-        Saves player dictionary to file
-        :param filename: where to save dictionary
+        :return: list of players in the portfolio
         """
-        with open(filename, 'w') as f:
-            json.dump(self.players, f, indent=4)
+        return self.ledger.get_players()
 
     def add(self, player_name):
         """
         Add *player_name* to the portfolio
         :param player_name: player
         """
-        self.load(self.filename)
-        if player_name not in self.players:
-            self.players[player_name] = {
-                "ev": [],
-                "actual": [],
-                "predicted": [],
-                "line": [],
-                "date": []
-            }
-        self.save(self.filename)
-
+        self.ledger.add_player(player_name)
 
     def remove(self, player_name):
         """
-        Removes *player_name* from the portfolio
+        Removes *player_name* from the portfolio, his betting history is kept in the ledger
         :param player_name: player to remove
         """
-        self.load(self.filename)
-        if player_name in self.players:
-            del self.players[player_name]
-        self.save(self.filename)
+        self.ledger.remove_player(player_name)
 
-    def get_player_next_event_date(self, player_name):
+    def get_player_next_event_date(self, player_name, category='PTS'):
         """
-        From the player dictionary, get the date of the next match
+        From the ledger, get the date of the player's most recent bet
         :param player_name: player
+        :param category: statistical category
         :return: date of next match or None
         """
-        self.load(self.filename)
-        if player_name in self.players:
-            length = len(self.players[player_name]['date'])
-            if length > 0:
-                date = self.players[player_name]['date'][length - 1]
-                return date
-            return None
-        return None
+        bet = self.ledger.get_last_bet(player_name, category)
+        return bet['date'] if bet is not None else None
 
+    @profiler.timed("portfolio.evaluate_player")
     def evaluate_player(self, player_name, category):
         """
         Evaluate a player's betting market based on predicted points for upcoming game
         :param player_name: player to evaluate
         :param category: statistical category
         """
-        date = today().strftime("%m/%d/%Y")
-        self.load(self.filename)
-
+        date = self.fetcher.transport.today()
 
         # don't want to evaluate unless last event has passed
-        next_event_date = self.get_player_next_event_date(player_name)
-        if next_event_date:
-            if next_event_date < date:
-                stats = self.fetcher.get_player_stats_on_date(player_name, next_event_date)
-                if stats is not None:
-                    self.players[player_name]['actual'].append(stats[category])
-                else:
-                    # player did not play so lets remove predicted data to avoid confusion
-                    self.players[player_name]['ev'].pop()
-                    self.players[player_name]['predicted'].pop()
-                    self.players[player_name]['line'].pop()
-                    self.players[player_name]['date'].pop()
+        last_bet = self.ledger.get_last_bet(player_name, category)
+        if last_bet:
+            if datetime.strptime(last_bet['date'], "%m/%d/%Y") < date:
+                if not last_bet['settled']:
+                    stats = self.fetcher.get_player_stats_on_date(player_name, last_bet['date'])
+                    self.ledger.settle_bets({last_bet['id']: self.get_actual(stats, category)})
             else:
                 return # already processed player for next event
 
@@ -166,9 +135,12 @@ class Portfolio:
 
         # get row for player's input
         input = self.fetcher.create_player_model_input(player_name, over_and_under['date'])
+        if input is None:
+            print(f"{player_name} has no model input available so can't be processed.")
+            return
 
         # make prediction
-        prediction = self.model.predict(input)
+        prediction = float(self.model.predict(input)[0])
 
         # calculate prob of hitting over and under
         p_over = self.calculator.probability_over(over_and_under['over']['line'], prediction, self.model.mae)
@@ -180,21 +152,141 @@ class Portfolio:
         else:
             ev = self.calculator.expected_value(p_under, over_and_under['under']['price'])
 
-        # update player's dictionary
-        self.players[player_name]['ev'].append(ev)
-        self.players[player_name]['predicted'].append(prediction)
-        self.players[player_name]['line'].append(over_and_under['over']['line'])
-        self.players[player_name]['date'].append(over_and_under['date'])
-        self.save(self.filename)
+        # record the bet
+        self.ledger.record_bets([{
+            'player': player_name,
+            'date': over_and_under['date'],
+            'market': category,
+            'line': over_and_under['over']['line'],
+            'predicted': prediction,
+            'ev': float(ev)
+        }])
+
+    @profiler.timed("portfolio.settle_pending")
+    def settle_pending(self, category, players=None, workers=8):
+        """
+        Settles every pending bet on a game that has passed. Box scores are fetched once per date and
+        every bet on that date is settled from them, dates are fetched concurrently
+        :param category: statistical category
+        :param players: only settle bets of these players, all players if None
+        :param workers: number of dates fetched at once
+        """
+        pending = self.ledger.get_pending_bets(self.fetcher.transport.today().strftime("%m/%d/%Y"), category)
+        if players is not None:
+            pending = [bet for bet in pending if bet['player'] in players]
+        dates = sorted({bet['date'] for bet in pending})
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            box_scores = dict(zip(dates, executor.map(self.fetcher.get_box_scores_on_date, dates)))
 
+        results = {}
+        for bet in pending:
+            stats = self.fetcher.get_player_stats_on_date(bet['player'], bet['date'], box_scores[bet['date']])
+            results[bet['id']] = self.get_actual(stats, category)
+        self.ledger.settle_bets(results)
 
-    def evaluate_all(self, category):
+    def get_actual(self, stats, category):
         """
-        Evaluate each player in dictionary
+        Result a bet is settled with. Players without a stat-line or with a null stat (DNP rows of the box
+        scores) did not play, their bet is voided
+        :param stats: stat-line returned by get_player_stats_on_date or None
         :param category: statistical category
+        :return: actual stat or None to void the bet
         """
-        for player, info in self.players.items():
-            self.evaluate_player(player, category)
+        if stats is None or pd.isna(stats.get(category)):
+            return None
+        return float(stats[category])
+
+    @profiler.timed("portfolio.evaluate_all")
+    def evaluate_all(self, category, workers=8):
+        """
+        Evaluate every player in the portfolio at once. Settlements and model inputs are fetched on a
+        worker pool, all inputs are scored with one predict call and the new bets are recorded in one write
+        :param category: statistical category
+        :param workers: number of concurrent fetches
+        """
+        date = self.fetcher.transport.today()
+        players = set(self.players)
+
+        self.settle_pending(category, players, workers)
+
+        # price players whose last bet was on a game that has passed
+        last_bets = self.ledger.get_last_bets(category)
+        to_evaluate = [player for player in players
+                       if player not in last_bets or datetime.strptime(last_bets[player]['date'], "%m/%d/%Y") < date]
+        props = {player: self.fetcher.get_player_props(player) for player in to_evaluate}
+        props = {player: info for player, info in props.items() if info}
+        inputs = self.fetcher.create_players_model_input({player: info['date'] for player, info in props.items()},
+                                                         workers=workers)
+        if inputs.empty:
+            return
+
+        evaluated = inputs.index.tolist()
+        predictions = np.asarray(self.model.predict(inputs)).ravel()
+        over_lines = np.array([props[player]['over']['line'] for player in evaluated])
+        under_lines = np.array([props[player]['under']['line'] for player in evaluated])
+        over_prices = np.array([props[player]['over']['price'] for player in evaluated])
+        under_prices = np.array([props[player]['under']['price'] for player in evaluated])
+
+        p_over = self.calculator.probability_over(over_lines, predictions, self.model.mae)
+        p_under = self.calculator.probability_under(under_lines, predictions, self.model.mae)
+        evs = np.where(p_over > p_under,
+                       self.calculator.expected_value(p_over, over_prices),
+                       self.calculator.expected_value(p_under, under_prices))
+
+        self.ledger.record_bets([{
+            'player': player,
+            'date': props[player]['date'],
+            'market': category,
+            'line': float(line),
+            'predicted': float(prediction),
+            'ev': float(ev)
+        } for player, line, prediction, ev in zip(evaluated, over_lines, predictions, evs)])
+
+    def rank_consistency(self, stats=('PTS',), windows=(2,), cutoff_date=DEFAULT_CUTOFF, min_minutes=30,
+                         min_stat=0, players=None):
+        """
+        Ranks players by consistency, defined by standard deviation, for every stat and window at once.
+        Built on a single league-wide game log download and one grouped computation per window
+        :param stats: statistical categories to rank on
+        :param windows: numbers of most recent games to track
+        :param cutoff_date: all the player's last games must be played after this date
+        :param min_minutes: min number of minutes player must average over the window
+        :param min_stat: minimum player must average in the statistical category
+        :param players: players to rank, defaults to the starters that aren't in the portfolio
+        :return: df with PLAYER, STAT, WINDOW, MEAN, STD, MIN_MEAN and RANK (1 = most consistent)
+        """
+        if players is None:
+            portfolio_players = set(self.players)
+            players = [player for player in self.STARTERS if player not in portfolio_players]
+        ids = {}
+        for player in players:
+            player_id = self.fetcher.get_player_id(player)
+            if player_id is not None:
+                ids[player_id] = player
+
+        logs = self.fetcher.get_league_player_logs(cutoff_date)
+        logs = logs[logs['PLAYER_ID'].isin(list(ids))]
+        logs = logs.sort_values(['PLAYER_ID', 'GAME_DATE'], ascending=[True, False])
+        logs['GAME_NUMBER'] = logs.groupby('PLAYER_ID').cumcount() # 0 is the most recent game
+        values = logs.melt(id_vars=['PLAYER_ID', 'GAME_NUMBER', 'MIN'], value_vars=list(stats),
+                           var_name='STAT', value_name='VALUE')
+
+        summaries = []
+        for window in windows:
+            recent = values[values['GAME_NUMBER'] < window]
+            summary = recent.groupby(['PLAYER_ID', 'STAT']).agg(
+                GAMES=('VALUE', 'size'), MEAN=('VALUE', 'mean'), STD=('VALUE', 'std'), MIN_MEAN=('MIN', 'mean')
+            ).reset_index()
+            summary['WINDOW'] = window
+            # players that haven't played enough games since cutoff_date aren't ranked
+            summaries.append(summary[summary['GAMES'] == window])
+        ranking = pd.concat(summaries, ignore_index=True)
+
+        ranking = ranking[(ranking['MEAN'] >= min_stat) & (ranking['MIN_MEAN'] >= min_minutes)]
+        ranking['PLAYER'] = ranking['PLAYER_ID'].map(ids)
+        ranking = ranking.sort_values(['STAT', 'WINDOW', 'STD'])
+        ranking['RANK'] = ranking.groupby(['STAT', 'WINDOW']).cumcount() + 1
+        return ranking[['PLAYER', 'STAT', 'WINDOW', 'MEAN', 'STD', 'MIN_MEAN', 'RANK']].reset_index(drop=True)
 
     def get_most_consistent_players(self, cutoff_date=DEFAULT_CUTOFF, num_players=10, num_games=2,
                                     min_minutes=30, category='PTS', min_stat=0):
@@ -209,22 +301,6 @@ class Portfolio:
         :param min_stat: minimum player must average in given statistical category
         :return: player's top *num_players* most consistent players in given stat over time period
         """
-        candidates = []
-        for player in self.STARTERS:
-            if player not in self.players:
-                try:
-                    stat_data = self.fetcher.get_last_x_stats_in_category(player, num_games, category, cutoff_date)
-                    if stat_data:
-                        minutes = self.fetcher.get_last_x_stats_in_category(player, num_games, 'MIN', cutoff_date)
-                        stat_mean, stat_std = self.calculator.get_mean_std( stat_data )
-                        minutes_mean, minutes_std = self.calculator.get_mean_std( minutes )
-                        if stat_mean >= min_stat and minutes_mean >= min_minutes:
-                            candidates.append((player, stat_mean, stat_std))
-
-                except Exception as e:
-                    print(e)
-
-        candidates.sort(key=lambda x:x[2])
-        return candidates[:num_players]
-
-
+        ranking = self.rank_consistency([category], [num_games], cutoff_date, min_minutes, min_stat)
+        top = ranking.head(num_players)
+        return list(zip(top['PLAYER'], top['MEAN'], top['STD']))
@@ -0,0 +1,40 @@
+import threading
+import time
+
+class RateLimitError(Exception):
+    """
+    Raised when an api answers that we're sending requests too quickly (HTTP 429)
+    """
+    pass
+
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        """
+        Token bucket shared by every thread sending requests to the same api
+        :param rate: number of requests allowed per second on average
+        :param burst: max number of requests that can be sent back to back after being idle
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until *tokens* tokens are available and takes them from the bucket
+        :param tokens: number of tokens needed
+        :return: number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
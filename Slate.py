@@ -0,0 +1,51 @@
+class Slate:
+    """
+    Everything about the games on a given date that is shared by all players playing on it. Built once
+    per date by DataFetcher.get_slate so schedules, rosters and team metrics aren't fetched per player
+    """
+    def __init__(self, date, matchups, player_to_team, team_metrics):
+        """
+        :param date: date of the games
+        :param matchups: list of (home team, away team) tuples
+        :param player_to_team: dict of player name to team name
+        :param team_metrics: dict of team name to (E_DEF_RATING, E_PACE)
+        """
+        self.date = date
+        self.matchups = matchups
+        self.player_to_team = player_to_team
+        self.team_metrics = team_metrics
+        self.home_teams = {home for home, away in matchups}
+        self.opponents = {}
+        for home, away in matchups:
+            self.opponents[home] = away
+            self.opponents[away] = home
+
+    def get_team(self, player_name):
+        """
+        Get the team a player is playing for on this date
+        :param player_name: player to query for
+        :return: team name or None if player's team isn't playing
+        """
+        return self.player_to_team.get(player_name)
+
+    def is_home(self, team_name):
+        """
+        :param team_name: team to query for
+        :return: 1 if team is playing at home, 0 otherwise
+        """
+        return 1 if team_name in self.home_teams else 0
+
+    def get_opponent(self, team_name):
+        """
+        :param team_name: team to query for
+        :return: name of team's opponent or None if team isn't playing
+        """
+        return self.opponents.get(team_name)
+
+    def get_opponent_metrics(self, team_name):
+        """
+        Get the estimated defensive rating and pace of a team's opponent
+        :param team_name: team to query for
+        :return: (E_DEF_RATING, E_PACE) tuple or None if not available
+        """
+        return self.team_metrics.get(self.get_opponent(team_name))
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import re
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from Instrumentation import profiler
+
+class TrainingStore:
+    DEFAULT_ROOT = "training_data"
+    STATE_DIR = "_state" # raw rows continuing each player's rolling windows, not training data
+    # full schema of the store, every partition is written with exactly these columns and types
+    DTYPES = {
+        'SEASON': pa.string(),
+        'PLAYER': pa.string(),
+        'GAME_DATE': pa.timestamp('ns'),
+        'HOME': pa.int8(),
+        'REST': pa.float32(),
+        'FORM_PTS': pa.float32(),
+        'FORM_FG2A': pa.float32(),
+        'FORM_FG3A': pa.float32(),
+        'FORM_FTA': pa.float32(),
+        'FG2_PCT': pa.float32(),
+        'FG3_PCT': pa.float32(),
+        'FT_PCT': pa.float32(),
+        'FORM_MIN': pa.float32(),
+        'OPP_PACE': pa.float32(),
+        'OPP_DEF_RATING': pa.float32(),
+        'PTS': pa.float32(),
+        'REB': pa.float32(),
+        'AST': pa.float32(),
+        'FG3M': pa.float32()
+    }
+
+    def __init__(self, root=DEFAULT_ROOT):
+        """
+        Columnar store of the training data, partitioned as <root>/<season>/<player>.parquet
+        :param root: directory holding the partitions
+        """
+        self.root = root
+        self.schema = pa.schema(list(self.DTYPES.items()))
+
+    def partition_path(self, season, player_name):
+        """
+        :param season: season of the partition
+        :param player_name: player of the partition
+        :return: path of the partition file
+        """
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', player_name).strip('_').lower()
+        return os.path.join(self.root, season, slug + '.parquet')
+
+    def state_path(self, season, player_name):
+        """
+        :param season: season of the state
+        :param player_name: player of the state
+        :return: path of the file holding the player's rolling window state
+        """
+        return os.path.join(self.root, self.STATE_DIR, os.path.relpath(self.partition_path(season, player_name), self.root))
+
+    def write_state(self, df, season, player_name):
+        """
+        Stores the raw game logs needed to continue a player's rolling features
+        :param df: raw game logs, as returned by nba_api
+        :param season: season of the logs
+        :param player_name: player of the logs
+        """
+        path = self.state_path(season, player_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def read_state(self, season, player_name):
+        """
+        :param season: season of the state
+        :param player_name: player of the state
+        :return: df of raw game logs or None if no state is stored
+        """
+        path = self.state_path(season, player_name)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    def get_partitions(self, seasons=None):
+        """
+        Lists partition files
+        :param seasons: only list partitions of these seasons, all seasons if None
+        :return: list of partition paths
+        """
+        if not os.path.isdir(self.root):
+            return []
+        if seasons is None:
+            seasons = sorted(d for d in os.listdir(self.root) if d != self.STATE_DIR)
+        paths = []
+        for season in seasons:
+            directory = os.path.join(self.root, season)
+            if os.path.isdir(directory):
+                paths += [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith('.parquet')]
+        return paths
+
+    def fingerprint(self):
+        """
+        Cheap fingerprint of the stored data built from the partitions' paths, sizes and modification
+        times, so it changes whenever a partition is rewritten without reading any data
+        :return: hex digest
+        """
+        digest = hashlib.sha256()
+        for path in self.get_partitions():
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, self.root)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        return digest.hexdigest()
+
+    def is_empty(self):
+        """
+        :return: bool indicating whether the store holds no partitions
+        """
+        return not self.get_partitions()
+
+    def to_table(self, df, season, player_name):
+        """
+        Converts a player's rows to the store's schema, missing columns are filled with nulls
+        :param df: rows of the player
+        :param season: season of the rows
+        :param player_name: player of the rows
+        :return: pyarrow table
+        """
+        df = df.copy()
+        df['SEASON'] = season
+        df['PLAYER'] = player_name
+        df = df.reindex(columns=self.schema.names)
+        df['GAME_DATE'] = pd.to_datetime(df['GAME_DATE'])
+        return pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+    def read_partition(self, season, player_name):
+        """
+        :param season: season of the partition
+        :param player_name: player of the partition
+        :return: df of the partition or None if it doesn't exist
+        """
+        path = self.partition_path(season, player_name)
+        if not os.path.exists(path):
+            return None
+        return pq.read_table(path, schema=self.schema).to_pandas()
+
+    @profiler.timed("training_store.write")
+    def write(self, df, season, player_name):
+        """
+        Replaces a player's partition with *df*
+        :param df: rows of the player
+        :param season: season of the rows
+        :param player_name: player of the rows
+        """
+        path = self.partition_path(season, player_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write next to the partition and swap it in so readers never see a half-written file
+        tmp_path = path + '.tmp'
+        pq.write_table(self.to_table(df, season, player_name), tmp_path)
+        os.replace(tmp_path, path)
+
+    def append(self, df, season, player_name):
+        """
+        Appends rows to a player's partition, rows of games already stored are replaced
+        :param df: new rows of the player
+        :param season: season of the rows
+        :param player_name: player of the rows
+        """
+        existing = self.read_partition(season, player_name)
+        new = self.to_table(df, season, player_name).to_pandas()
+        if existing is not None:
+            dated = existing['GAME_DATE'].notna()
+            existing = existing[~dated | ~existing['GAME_DATE'].isin(new['GAME_DATE'])]
+            new = pd.concat([existing, new], ignore_index=True)
+        self.write(new, season, player_name)
+
+    @profiler.timed("training_store.load")
+    def load(self, columns=None, filters=None, seasons=None):
+        """
+        Loads the training data in a single read
+        :param columns: columns to read, all columns if None
+        :param filters: pyarrow predicates rows must satisfy, e.g. [('PLAYER', '=', 'Nikola Jokic')]
+        :param seasons: only read partitions of these seasons, all seasons if None
+        :return: df of training data
+        """
+        paths = self.get_partitions(seasons)
+        if not paths:
+            return pd.DataFrame(columns=columns if columns is not None else self.schema.names)
+        dataset = pq.ParquetDataset(paths, schema=self.schema, filters=filters)
+        return dataset.read(columns=columns).to_pandas()
+
+    def import_csv_dir(self, directory, season):
+        """
+        Imports per-player csv files (named <player>.csv) into the store
+        :param directory: directory holding the csv files
+        :param season: season the files belong to
+        """
+        for file in os.listdir(directory):
+            if file.endswith('.csv'):
+                self.write(pd.read_csv(os.path.join(directory, file)), season, file[:-len('.csv')])
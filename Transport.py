@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+from Instrumentation import profiler
+
+class Transport:
+    PASSTHROUGH = "passthrough"
+    RECORD = "record"
+    REPLAY = "replay"
+    MODES = [PASSTHROUGH, RECORD, REPLAY]
+    DEFAULT_ARCHIVE = "fixtures/recording.json.gz"
+
+    def __init__(self, mode=PASSTHROUGH, path=DEFAULT_ARCHIVE):
+        """
+        Sits between the fetchers and the apis. Passthrough sends every request as usual, record also keeps
+        every response in a gzipped archive keyed by api, endpoint and parameters, replay answers every request
+        from that archive without touching the network, the cache or the rate limiter. The archive keeps the
+        date it was recorded on, replays run as of that date so they request exactly what was recorded
+        :param mode: one of MODES
+        :param path: fixture archive
+        """
+        if mode not in self.MODES:
+            raise Exception(f"Unknown transport mode '{mode}', expected one of {', '.join(self.MODES)}.")
+        self.mode = mode
+        self.path = path
+        self.responses = {}
+        self.recorded_on = datetime.today().strftime('%Y-%m-%d')
+        self.lock = threading.Lock()
+        if mode == self.REPLAY:
+            if not os.path.exists(path):
+                raise Exception(f"No fixture archive at {path}, record a run first.")
+            archive = self.read_archive()
+            self.responses = archive['responses']
+            self.recorded_on = archive['recorded_on']
+        elif mode == self.RECORD and os.path.exists(path):
+            # commands recorded on the same day extend one archive, e.g. a scan followed by a refresh
+            archive = self.read_archive()
+            if archive['recorded_on'] == self.recorded_on:
+                self.responses = archive['responses']
+
+    def read_archive(self):
+        """
+        :return: dict with the recording date and the responses of the archive
+        """
+        with gzip.open(self.path, 'rt') as f:
+            return json.load(f)
+
+    def today(self):
+        """
+        Date the run happens on, the recording's date when replaying
+        :return: datetime of the day at midnight
+        """
+        if self.mode == self.REPLAY:
+            return datetime.strptime(self.recorded_on, '%Y-%m-%d')
+        return datetime.combine(datetime.today(), datetime.min.time())
+
+    def make_key(self, api, endpoint, params):
+        """
+        Builds the archive key of a request
+        :param api: name of the api, e.g. 'nba_api'
+        :param endpoint: name of the endpoint or path of the request
+        :param params: dict of request parameters, secrets must not be included
+        :return: key string, identical for identical requests regardless of parameter order
+        """
+        return f"{api}:{endpoint}?" + json.dumps(params, sort_keys=True, default=str)
+
+    def fetch(self, api, endpoint, params, request):
+        """
+        Returns the response of a request according to the transport's mode
+        :param api: name of the api
+        :param endpoint: name of the endpoint or path of the request
+        :param params: dict of request parameters
+        :param request: function sending the request and returning its json-serializable result
+        :return: result of the request
+        """
+        if self.mode == self.PASSTHROUGH:
+            return request()
+        key = self.make_key(api, endpoint, params)
+        if self.mode == self.REPLAY:
+            if key not in self.responses:
+                raise Exception(f"No recorded response for {key}, record the run again.")
+            profiler.count('replayed_responses')
+            return self.responses[key]
+        response = request()
+        with self.lock:
+            self.responses[key] = response
+        profiler.count('recorded_responses')
+        return response
+
+    def save(self):
+        """
+        Writes the recorded responses to the archive, nothing is written unless recording
+        """
+        if self.mode != self.RECORD:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with self.lock, gzip.open(tmp_path, 'wt', compresslevel=9) as f:
+            json.dump({'recorded_on': self.recorded_on, 'responses': self.responses}, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        print(f"Recorded {len(self.responses)} responses to {self.path}.")
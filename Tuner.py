@@ -0,0 +1,155 @@
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from catboost import CatBoostRegressor
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.model_selection import KFold
+from Model import Model
+
+# data of the tuning run, set once per worker process so trials don't pickle the training data
+worker_state = {}
+
+def init_worker(X, y, folds, best_score):
+    """
+    Initializes a worker process of the tuner
+    :param X: feature matrix
+    :param y: labels
+    :param folds: list of (train indices, validation indices) tuples shared by every trial
+    :param best_score: shared value holding the best cross-validated mae found so far
+    """
+    worker_state.update(X=X, y=y, folds=folds, best_score=best_score)
+
+def evaluate_trial(params, prune_margin):
+    """
+    Cross-validates one set of CatBoost settings. The trial is pruned as soon as the mean mae of the folds
+    done so far is worse than the best finished trial by more than *prune_margin*
+    :param params: CatBoost settings
+    :param prune_margin: relative margin over the best score before a trial is pruned
+    :return: dict with the params, fold maes, mean mae and whether the trial was pruned
+    """
+    X, y, folds, best_score = (worker_state[key] for key in ['X', 'y', 'folds', 'best_score'])
+    fold_maes = []
+    for train_index, val_index in folds:
+        model = CatBoostRegressor(**params)
+        model.fit(X[train_index], y[train_index])
+        fold_maes.append(float(np.abs(model.predict(X[val_index]) - y[val_index]).mean()))
+        if len(fold_maes) < len(folds) and np.mean(fold_maes) > best_score.value * (1 + prune_margin):
+            return {'params': params, 'fold_maes': fold_maes, 'mae': float(np.mean(fold_maes)), 'pruned': True}
+    mae = float(np.mean(fold_maes))
+    with best_score.get_lock():
+        best_score.value = min(best_score.value, mae)
+    return {'params': params, 'fold_maes': fold_maes, 'mae': mae, 'pruned': False}
+
+class Tuner:
+    DEFAULT_GRID = {
+        'iterations': [300, 600],
+        'learning_rate': [0.02, 0.04, 0.08],
+        'depth': [4, 6, 8],
+        'l2_leaf_reg': [1, 3, 9]
+    }
+
+    def __init__(self, features, target_col='PTS', grid=None, folds=5, search='grid', trials=20, workers=None,
+                 prune_margin=0.05, random_state=42):
+        """
+        Hyperparameter search of the CatBoost settings with k-fold cross-validation, trials run on a
+        process pool and every process gets an equal share of the cpu threads
+        :param features: feature columns
+        :param target_col: column we'd like to predict
+        :param grid: dict of CatBoost setting to the values to try, defaults to DEFAULT_GRID
+        :param folds: number of cross-validation folds
+        :param search: 'grid' tries every combination, 'random' samples *trials* of them
+        :param trials: number of combinations tried by a random search
+        :param workers: number of trials run at once, defaults to half the cpus
+        :param prune_margin: relative margin over the best score before a trial is stopped early
+        :param random_state: seed of the folds, the sampling and CatBoost
+        """
+        self.features = features
+        self.target_col = target_col
+        self.grid = grid or self.DEFAULT_GRID
+        self.folds = folds
+        self.search = search
+        self.trials = trials
+        self.workers = workers or max(1, (os.cpu_count() or 1) // 2)
+        self.prune_margin = prune_margin
+        self.random_state = random_state
+        self.fold_cache = {}
+
+    def get_candidates(self):
+        """
+        :return: list of dicts of CatBoost settings to try
+        """
+        keys = list(self.grid)
+        combinations = [dict(zip(keys, values)) for values in itertools.product(*(self.grid[key] for key in keys))]
+        if self.search == 'random' and self.trials < len(combinations):
+            rng = np.random.default_rng(self.random_state)
+            combinations = [combinations[i] for i in rng.choice(len(combinations), self.trials, replace=False)]
+        return combinations
+
+    def get_folds(self, num_rows):
+        """
+        Splits are computed once per number of rows and reused by every trial and every later search
+        :param num_rows: number of training rows
+        :return: list of (train indices, validation indices) tuples
+        """
+        if num_rows not in self.fold_cache:
+            kfold = KFold(n_splits=self.folds, shuffle=True, random_state=self.random_state)
+            self.fold_cache[num_rows] = list(kfold.split(np.arange(num_rows)))
+        return self.fold_cache[num_rows]
+
+    def tune(self, df):
+        """
+        Runs the search
+        :param df: training data
+        :return: list of trial results sorted by cross-validated mae, pruned trials last
+        """
+        df = df.dropna(subset=[self.target_col])
+        X = df[self.features].to_numpy(dtype=float)
+        y = df[self.target_col].to_numpy(dtype=float)
+        folds = self.get_folds(len(df))
+        thread_count = max(1, (os.cpu_count() or 1) // self.workers)
+        candidates = [Model(self.features, random_state=self.random_state,
+                            params=candidate | {'thread_count': thread_count}).params
+                      for candidate in self.get_candidates()]
+
+        best_score = multiprocessing.Value('d', float('inf'))
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                 initargs=(X, y, folds, best_score)) as executor:
+            results = list(executor.map(evaluate_trial, candidates, [self.prune_margin] * len(candidates)))
+        for result in results:
+            print(f"{'pruned' if result['pruned'] else 'done':<7} mae {result['mae']:.3f} "
+                  f"after {len(result['fold_maes'])} folds  {self.get_tuned_params(result['params'])}")
+        return sorted(results, key=lambda result: (result['pruned'], result['mae']))
+
+    def get_tuned_params(self, params):
+        """
+        :param params: full CatBoost settings of a trial
+        :return: the settings that were searched over
+        """
+        return {key: params[key] for key in self.grid}
+
+    def save_best(self, results, path=Model.TUNED_PARAMS_FILE):
+        """
+        Saves the best trial's settings, Model.use_tuned_params loads them
+        :param results: list returned by tune
+        :param path: json file to write
+        :return: dict of the saved settings
+        """
+        best = results[0]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'params': self.get_tuned_params(best['params']),
+                'cv_mae': best['mae'],
+                'fold_maes': best['fold_maes'],
+                'folds': self.folds,
+                'target_col': self.target_col,
+                'trials': len(results),
+                'pruned': sum(result['pruned'] for result in results),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+            }, f, indent=4)
+        return self.get_tuned_params(best['params'])
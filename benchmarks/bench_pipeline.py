@@ -0,0 +1,411 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+from nba_api.stats.static import players as nba_players
+from nba_api.stats.static import teams
+from ApiCache import ApiCache
+from DataFetcher import DataFetcher
+from Ledger import Ledger
+from Model import Model
+from Portfolio import Portfolio
+from TrainingStore import TrainingStore
+from Transport import Transport
+
+RESULTS_FILE = os.path.join(ROOT, "benchmarks", "results.json")
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline.json")
+FIXTURES_FILE = os.path.join(ROOT, "benchmarks", "fixtures", "pipeline.json.gz")
+REPEATS = 3
+TOLERANCE = 0.2 # slowdown or memory growth relative to the baseline that is flagged as a regression
+NUM_FORM_GAMES = 5
+SIMULATION_SIZES = [100, 1000, 10000]
+BET_DATES = 30
+SEASON = "2024-25"
+FIRST_GAME = "2025-01-02"
+NUM_GAMES = 60 # games per player in the synthetic fixtures, one every other day
+SLATE_DATE = "05/01/2025" # day after the last synthetic game, every team plays
+RECORD_INSTRUCTIONS = (
+    "Record one on a game day with:\n"
+    f"  python main.py --transport record --fixtures {os.path.relpath(FIXTURES_FILE, ROOT)} scan\n"
+    f"  python main.py --transport record --fixtures {os.path.relpath(FIXTURES_FILE, ROOT)} refresh"
+)
+
+class FixtureFetcher(DataFetcher):
+    def __init__(self, workdir):
+        """
+        DataFetcher answering every nba_api call from deterministic fixtures shaped like the api's responses,
+        so the pipeline can be benchmarked offline. Fixtures are converted to dfs on every call like cached
+        responses are, only the network and the cache lookup are left out
+        :param workdir: directory holding the cache and the training store
+        """
+        super().__init__(season=SEASON, cache=ApiCache(os.path.join(workdir, "api_cache.sqlite")),
+                         training_store=TrainingStore(os.path.join(workdir, "training_data")))
+        self.nba_teams = sorted(teams.get_teams(), key=lambda team: team['full_name'])
+        # five starters per team, in the order of Portfolio.STARTERS
+        self.rosters = {team['id']: Portfolio.STARTERS[5 * i:5 * i + 5] for i, team in enumerate(self.nba_teams)}
+        self.player_teams = {player: team_id for team_id, roster in self.rosters.items() for player in roster}
+        self.player_names = {self.get_player_id(player): player for player in Portfolio.STARTERS}
+        self.fixtures = {}
+
+    def call_endpoint(self, endpoint, ttl=None, **params):
+        """
+        :param endpoint: nba_api endpoint class
+        :param ttl: ignored, fixtures never expire
+        :param params: parameters passed to the endpoint
+        :return: dict of data set name to df
+        """
+        name = endpoint.__name__
+        fixture_key = (name, params.get('player_id') or params.get('player_id_nullable') or params.get('team_id'))
+        if fixture_key not in self.fixtures:
+            self.fixtures[fixture_key] = self.make_fixture(name, params)
+        return {key: pd.DataFrame(data_set['data'], columns=data_set['headers'])
+                for key, data_set in self.fixtures[fixture_key].items()}
+
+    def make_fixture(self, name, params):
+        """
+        Builds the response of an endpoint
+        :param name: name of the endpoint
+        :param params: parameters passed to the endpoint
+        :return: dict of data set name to dict of headers and data, as returned by nba_api
+        """
+        if name == 'PlayerGameLog':
+            return {name: self.make_game_log(params['player_id'])}
+        if name == 'PlayerGameLogs':
+            # the league-wide endpoint returns the most recent game first
+            log = self.make_game_log(params['player_id_nullable'])
+            return {name: {'headers': log['headers'], 'data': log['data'][::-1]}}
+        if name == 'TeamEstimatedMetrics':
+            rng = np.random.default_rng(0)
+            return {name: {'headers': ['TEAM_ID', 'TEAM_NAME', 'E_DEF_RATING', 'E_PACE'],
+                           'data': [[team['id'], team['full_name'], rng.normal(112, 3), rng.normal(99, 2)]
+                                    for team in self.nba_teams]}}
+        if name == 'ScoreboardV2':
+            team_ids = [team['id'] for team in self.nba_teams]
+            return {'GameHeader': {'headers': ['GAME_ID', 'GAME_STATUS_ID', 'HOME_TEAM_ID', 'VISITOR_TEAM_ID'],
+                                   'data': [[f"004240{i:04d}", 1, home, away] for i, (home, away)
+                                            in enumerate(zip(team_ids[::2], team_ids[1::2]))]}}
+        if name == 'CommonTeamRoster':
+            return {name: {'headers': ['PLAYER'], 'data': [[player] for player in self.rosters[params['team_id']]]}}
+        raise Exception(f"No fixture for {name}.")
+
+    def make_game_log(self, player_id):
+        """
+        Season game log of a player, oldest game first, seeded by the player's id
+        :param player_id: player's id in nba_api
+        :return: dict of headers and data
+        """
+        rng = np.random.default_rng(player_id)
+        team_id = self.player_teams.get(self.player_names.get(player_id), self.nba_teams[0]['id'])
+        abbreviations = {team['id']: team['abbreviation'] for team in self.nba_teams}
+        opponents = [team['abbreviation'] for team in self.nba_teams if team['id'] != team_id]
+        dates = pd.date_range(FIRST_GAME, periods=NUM_GAMES, freq='2D')
+
+        fga = rng.poisson(16, NUM_GAMES)
+        fg3a = rng.binomial(fga, 0.4)
+        fg3m = rng.binomial(fg3a, 0.36)
+        fgm = fg3m + rng.binomial(fga - fg3a, 0.5)
+        fta = rng.poisson(5, NUM_GAMES)
+        ftm = rng.binomial(fta, 0.8)
+        pts = 2 * (fgm - fg3m) + 3 * fg3m + ftm
+        data = []
+        for i, date in enumerate(dates):
+            separator = 'vs.' if rng.random() < 0.5 else '@'
+            matchup = f"{abbreviations[team_id]} {separator} {opponents[rng.integers(len(opponents))]}"
+            data.append([date.strftime("%Y-%m-%dT00:00:00"), matchup, round(rng.normal(32, 4), 1),
+                         int(pts[i]), int(fgm[i]), int(fga[i]), int(fg3m[i]), int(fg3a[i]), int(ftm[i]),
+                         int(fta[i]), int(rng.poisson(6)), int(rng.poisson(5))])
+        return {'headers': ['GAME_DATE', 'MATCHUP', 'MIN', 'PTS', 'FGM', 'FGA', 'FG3M', 'FG3A', 'FTM', 'FTA',
+                            'REB', 'AST'],
+                'data': data}
+
+def make_event_odds(fetcher, players, event_index):
+    """
+    Odds API response of one event, every player has an over and an under in every market at two bookmakers
+    :param fetcher: data fetcher, used for its markets
+    :param players: players of the event
+    :param event_index: seeds the lines
+    :return: dict shaped like the api's event odds
+    """
+    rng = np.random.default_rng(event_index)
+    bookmakers = []
+    for bookmaker in ["draftkings", "fanduel"]:
+        markets = []
+        for market in fetcher.MARKETS:
+            outcomes = []
+            for player in players:
+                line = float(rng.integers(5, 35)) + 0.5
+                outcomes += [{"name": "Over", "description": player, "point": line, "price": 1.87},
+                             {"name": "Under", "description": player, "point": line, "price": 1.95}]
+            markets.append({"key": market, "outcomes": outcomes})
+        bookmakers.append({"key": bookmaker, "markets": markets})
+    return {"id": f"event{event_index}", "commence_time": "2025-05-01T23:30:00Z", "bookmakers": bookmakers}
+
+def load_synthetic(workdir):
+    """
+    Generated fixtures, so the benchmarks run on a clean checkout without any recording
+    :param workdir: directory holding the cache and the training store
+    :return: tuple of the fetcher, the players, dict of player to the date of his slate game and the event odds
+    """
+    fetcher = FixtureFetcher(workdir)
+    players = Portfolio.STARTERS
+    events = [make_event_odds(fetcher, players[i:i + 10], i // 10) for i in range(0, len(players), 10)]
+    return fetcher, players, {player: SLATE_DATE for player in players}, events
+
+def load_recorded(workdir, fixtures):
+    """
+    Recorded responses replayed through the transport, so the pipeline runs offline on real responses
+    without sleeps
+    :param workdir: directory holding the cache and the training store
+    :param fixtures: fixture archive recorded with main.py --transport record
+    :return: tuple of the fetcher, the players, dict of player to the date of his slate game and the event odds
+    """
+    fetcher = DataFetcher(cache=ApiCache(os.path.join(workdir, "api_cache.sqlite")),
+                          training_store=TrainingStore(os.path.join(workdir, "training_data")),
+                          transport=Transport(Transport.REPLAY, fixtures))
+    # players refreshed during the recording, and the slate of the recorded odds
+    player_ids = [params['player_id'] for params, _ in get_recorded(fetcher.transport, 'nba_api',
+                                                                     lambda endpoint: endpoint == 'PlayerGameLog')]
+    players = [nba_players.find_player_by_id(player_id)['full_name'] for player_id in dict.fromkeys(player_ids)]
+    props = fetcher.get_all_player_props()
+    if not players or not props:
+        raise Exception(f"The archive at {fixtures} has no player game logs or odds. {RECORD_INSTRUCTIONS}")
+    events = [odds for _, odds in get_recorded(fetcher.transport, 'odds_api', lambda path: path.endswith('/odds'))]
+    return fetcher, players, {player: info['date'] for player, info in props.items()}, events
+
+def get_recorded(transport, api, endpoint_filter):
+    """
+    :param transport: replaying transport
+    :param api: name of the api
+    :param endpoint_filter: function telling whether an endpoint name or path is wanted
+    :return: list of (params, response) tuples of the matching recorded requests
+    """
+    recorded = []
+    for key, response in transport.responses.items():
+        prefix, params = key.split("?", 1)
+        key_api, endpoint = prefix.split(":", 1)
+        if key_api == api and endpoint_filter(endpoint):
+            recorded.append((json.loads(params), response))
+    return recorded
+
+def measure(fn, repeats=REPEATS):
+    """
+    Times a function and measures its peak memory. Peak memory is measured in a separate run because
+    tracing allocations slows the code down, native allocations (e.g. CatBoost's) are not traced
+    :param fn: function to measure
+    :param repeats: number of timed runs
+    :return: tuple of median wall time in seconds and peak traced memory in bytes
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+def run_benchmarks(workdir, fixtures=None, repeats=REPEATS, only=None):
+    """
+    Runs the pipeline benchmarks: feature building, data loading, training, simulation, odds parsing and
+    portfolio I/O
+    :param workdir: scratch directory
+    :param fixtures: fixture archive replayed by the fetcher, generated fixtures are used if None
+    :param repeats: number of timed runs of every benchmark
+    :param only: names of the benchmarks to run, all of them if None
+    :return: dict of benchmark name to its result
+    """
+    if fixtures is None:
+        fetcher, players, slate, events = load_synthetic(workdir)
+    else:
+        fetcher, players, slate, events = load_recorded(workdir, fixtures)
+    try:
+        return run_pipeline_benchmarks(workdir, fetcher, players, slate, events, repeats, only)
+    finally:
+        fetcher.close()
+
+def run_pipeline_benchmarks(workdir, fetcher, players, slate, events, repeats=REPEATS, only=None):
+    """
+    :param workdir: scratch directory
+    :param fetcher: data fetcher serving the fixtures
+    :param players: players whose datasets are built
+    :param slate: dict of player to the date of his slate game
+    :param events: event odds parsed by the odds benchmark
+    :param repeats: number of timed runs of every benchmark
+    :param only: names of the benchmarks to run, all of them if None
+    :return: dict of benchmark name to its result
+    """
+    state = {}
+    results = {}
+
+    def bench(name, fn, items, unit):
+        if only is not None and name not in only:
+            return
+        seconds, peak = measure(fn, repeats)
+        results[name] = {'seconds': seconds, 'items': items, 'throughput': items / seconds, 'unit': unit,
+                         'peak_mb': peak / 2 ** 20}
+        print(f"{name:<24} {seconds * 1000:>10.1f} ms {items / seconds:>14,.0f} {unit}/s "
+              f"{peak / 2 ** 20:>9.1f} MB peak")
+
+    # features, the datasets are needed by every later benchmark so they are always built once
+    state['datasets'] = fetcher.create_player_datasets(players, NUM_FORM_GAMES)
+    num_rows = sum(len(df) for df in state['datasets'].values())
+    one_player = fetcher.get_player_games(players[:1])
+    opponent_metrics = fetcher.get_opponent_metrics()
+    bench("features_player", lambda: fetcher.build_player_features(fetcher.get_player_games(players[:1]),
+                                                                   NUM_FORM_GAMES, opponent_metrics),
+          len(one_player), "games")
+    bench("features_batch", lambda: fetcher.create_player_datasets(players, NUM_FORM_GAMES), num_rows, "rows")
+
+    def build_slate_inputs():
+        fetcher.slates.clear()
+        state['inputs'] = fetcher.create_players_model_input(slate)
+    bench("features_slate", build_slate_inputs, len(slate), "players")
+
+    # data loading
+    csv_dir = os.path.join(workdir, "player_data")
+    os.makedirs(csv_dir, exist_ok=True)
+    for player, df in state['datasets'].items():
+        df.to_csv(os.path.join(csv_dir, f"{player}.csv"), index=False)
+    bench("csv_load", lambda: pd.concat([pd.read_csv(os.path.join(csv_dir, file)) for file in os.listdir(csv_dir)],
+                                        ignore_index=True), num_rows, "rows")
+    columns = fetcher.FEATURES + ['PTS']
+    bench("store_load", lambda: fetcher.training_store.load(columns=columns), num_rows, "rows")
+
+    # training and simulation
+    df = fetcher.training_store.load(columns=columns)
+    model = Model(fetcher.FEATURES)
+    bench("train", lambda: model.train(df), len(df), "rows")
+    if not model.stds:
+        model.train(df)
+    row = df[fetcher.FEATURES].iloc[[0]]
+    rng = np.random.default_rng(0)
+    for n in SIMULATION_SIZES:
+        bench(f"simulate_n{n}", lambda: model.simulate_batch(row, ['REST'], n, rng), n, "draws")
+    inputs = state.get('inputs')
+    if inputs is None or inputs.empty:
+        inputs = df[fetcher.FEATURES].head(len(slate))
+    bench("simulate_slate_n1000", lambda: model.simulate_slate(inputs, ['REST'], 1000, rng),
+          len(inputs) * 1000, "draws")
+
+    # odds parsing of every event
+    num_outcomes = sum(len(market['outcomes']) for event in events for bookmaker in event['bookmakers']
+                       for market in bookmaker['markets'])
+    def parse_odds():
+        overall = {}
+        for odds in events:
+            overall = overall | fetcher.fetch_player_props(odds)
+        return overall
+    bench("odds_parse", parse_odds, num_outcomes, "outcomes")
+
+    # portfolio I/O, every timed write starts from an empty ledger
+    dates = pd.date_range("2025-01-02", periods=BET_DATES).strftime("%m/%d/%Y")
+    bets = [{'player': player, 'date': date, 'market': 'PTS', 'line': 20.5, 'predicted': 22.0, 'ev': 0.1}
+            for date in dates for player in players]
+    ledgers = []
+    def write_portfolio():
+        ledger = Ledger(os.path.join(workdir, f"portfolio{len(ledgers)}.db"))
+        ledgers.append(ledger)
+        for player in players:
+            ledger.add_player(player)
+        ledger.record_bets(bets)
+        pending = ledger.get_pending_bets(dates[-1])
+        ledger.settle_bets({bet['id']: 20.0 for bet in pending})
+    bench("portfolio_write", write_portfolio, len(bets), "bets")
+    if not ledgers:
+        write_portfolio()
+    def read_portfolio():
+        ledger = ledgers[0]
+        ledger.get_players()
+        ledger.get_last_bets('PTS')
+        return ledger.get_history(market='PTS')
+    bench("portfolio_read", read_portfolio, len(bets), "bets")
+    return results
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compares results against a baseline
+    :param results: dict of benchmark name to its result
+    :param baseline: dict of benchmark name to its baseline result
+    :param tolerance: allowed relative slowdown and memory growth
+    :return: list of regression descriptions
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        time_ratio = result['seconds'] / baseline[name]['seconds']
+        memory_ratio = result['peak_mb'] / baseline[name]['peak_mb'] if baseline[name]['peak_mb'] else 1.0
+        print(f"{name:<24} time x{time_ratio:.2f}  memory x{memory_ratio:.2f}")
+        if time_ratio > 1 + tolerance:
+            regressions.append(f"{name} is {time_ratio:.2f}x slower than the baseline")
+        if memory_ratio > 1 + tolerance:
+            regressions.append(f"{name} uses {memory_ratio:.2f}x the baseline's peak memory")
+    return regressions
+
+def create_parser():
+    """
+    :return: argparse parser of the benchmark options
+    """
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the prediction pipeline")
+    parser.add_argument("--fixtures", help=f"fixture archive replayed by the benchmarks, defaults to "
+                                           f"{os.path.relpath(FIXTURES_FILE, ROOT)} if it exists and to "
+                                           f"generated fixtures otherwise")
+    parser.add_argument("--only", nargs="*", help="benchmarks to run, all of them by default")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="timed runs of every benchmark")
+    parser.add_argument("--output", default=RESULTS_FILE, help="json file the results are written to")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="json file of the baseline results")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="relative slowdown or memory growth flagged as a regression")
+    return parser
+
+def main():
+    args = create_parser().parse_args()
+    fixtures = args.fixtures
+    if fixtures is None and os.path.exists(FIXTURES_FILE):
+        fixtures = FIXTURES_FILE
+    if fixtures is not None and not os.path.exists(fixtures):
+        print(f"No fixture archive at {fixtures}. {RECORD_INSTRUCTIONS}")
+        sys.exit(1)
+    source = os.path.relpath(fixtures, ROOT) if fixtures is not None else "synthetic"
+    print(f"Benchmarking on {source} fixtures")
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_benchmarks(workdir, fixtures, args.repeats, args.only)
+    report = {'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+              'fixtures': source, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one.")
+        return
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('fixtures', source) != source:
+        # timings of different fixtures can't be compared
+        print(f"The baseline at {args.baseline} was measured on {baseline['fixtures']} fixtures, "
+              f"run with --save-baseline to measure one on {source} fixtures.")
+        return
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_STARTUP_SECONDS = 0.5
+RUNS = 5
+# modules that must not be imported just to start the cli
+HEAVY_MODULES = ['pandas', 'numpy', 'catboost', 'matplotlib', 'scipy', 'nba_api', 'sklearn']
+
+def time_command(args, runs=RUNS):
+    """
+    Runs a command several times
+    :param args: command line to run
+    :param runs: number of runs
+    :return: median wall time in seconds
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def get_heavy_imports():
+    """
+    :return: heavy modules loaded by importing main and building its parser
+    """
+    code = ("import sys, main; main.create_parser(); "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return [m for m in result.stdout.strip().split(',') if m]
+
+def main():
+    heavy = get_heavy_imports()
+    startup = time_command([sys.executable, "main.py", "--help"])
+    print(f"main.py --help: {startup * 1000:.1f} ms (limit {MAX_STARTUP_SECONDS * 1000:.0f} ms)")
+    failed = False
+    if heavy:
+        print(f"FAIL: importing main loads {', '.join(heavy)}")
+        failed = True
+    if startup > MAX_STARTUP_SECONDS:
+        print("FAIL: startup is too slow")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
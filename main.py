@@ -1,108 +1,494 @@
-from Calculator import Calculator
-from Dashboard import Dashboard
-from DataFetcher import DataFetcher
-from Model import Model
-from Portfolio import Portfolio
-import pandas as pd
-import os
+import argparse
+from Instrumentation import profiler
+from Transport import Transport
 
-# Create data fetcher
-fetcher = DataFetcher()
+# Heavy modules (pandas, numpy, catboost, nba_api, matplotlib, scipy) are imported inside the functions
+# that need them so quick commands like --help don't pay for them
 
-# Create calculator
-calculator = Calculator()
+N_SIMULATIONS = 1000 # number of simulations
+PORTFOLIO_FILE = "betting_data/portfolio.db"
+LEGACY_PORTFOLIO_FILE = "betting_data/portfolio.json" # imported into the ledger on first run
+PLAYER_DATA_DIR = "player_data"
 
-# Create dashboard
-dashboard = Dashboard()
-
-all_files = os.listdir("player_data")
-csv_files = [f for f in all_files if f.endswith('.csv')]
-
-# Create dataset
-df = pd.DataFrame()
-for file in csv_files:
-    df = pd.concat([df, pd.read_csv("player_data/" + file)])
+def create_fetcher(transport=None):
+    """
+    Create data fetcher
+    :param transport: Transport recording or replaying the api responses, requests are sent as usual if None
+    :return: DataFetcher
+    """
+    from DataFetcher import DataFetcher
+    return DataFetcher(transport=transport)
 
-# Create model
-n = 1000 # number of simulations
-model = Model(fetcher.FEATURES)
-model.train(df)
+def create_model(fetcher, force_train=False):
+    """
+    Create model, it is only retrained when the training data changed since the saved artifact
+    :param fetcher: data fetcher owning the training store
+    :param force_train: retrain even if the saved artifact is up to date
+    :return: trained Model
+    """
+    from Model import Model
+    # the per-player csv files are imported into the training store on first run
+    store = fetcher.training_store
+    if store.is_empty():
+        store.import_csv_dir(PLAYER_DATA_DIR, fetcher.season)
+    model = Model(fetcher.FEATURES)
+    # settings saved by the tune command, the saved model is retrained when they change
+    model.use_tuned_params()
+    load_df = lambda: store.load(columns=fetcher.FEATURES + ['PTS'])
+    if force_train:
+        model.train(load_df())
+        model.save(fingerprint=store.fingerprint())
+    else:
+        model.load_or_train(store.fingerprint(), load_df)
+    return model
 
-# Create portfolio
-filename = "betting_data/portfolio.json"
-portfolio = Portfolio(filename, fetcher, calculator, model)
+def create_multi_model(fetcher, force_train=False):
+    """
+    Create the model predicting every market's stat at once, it is only retrained when the training
+    data changed since the saved artifact
+    :param fetcher: data fetcher owning the training store
+    :param force_train: retrain even if the saved artifact is up to date
+    :return: trained MultiTargetModel or None if the training data has no rows with every target
+    """
+    from MultiTargetModel import MultiTargetModel
+    store = fetcher.training_store
+    if store.is_empty():
+        store.import_csv_dir(PLAYER_DATA_DIR, fetcher.season)
+    model = MultiTargetModel(fetcher.FEATURES, fetcher.TARGETS)
+    load_df = lambda: store.load(columns=fetcher.FEATURES + fetcher.TARGETS)
+    if force_train:
+        if model.train(load_df()) is not None:
+            model.save(fingerprint=store.fingerprint())
+    else:
+        model.load_or_train(store.fingerprint(), load_df)
+    return model if model.mae is not None else None
 
-# Create odds dict
-odds_dict = fetcher.get_all_player_props()
+def create_portfolio(fetcher, model):
+    """
+    Create portfolio
+    :param fetcher: data fetcher
+    :param model: trained model
+    :return: Portfolio
+    """
+    from Calculator import Calculator
+    from Portfolio import Portfolio
+    return Portfolio(PORTFOLIO_FILE, fetcher, Calculator(), model, LEGACY_PORTFOLIO_FILE)
 
-def refresh_data_files(players, num_games):
+def refresh_data_files(fetcher, players, num_games, workers=8, incremental=False):
     """
-    Creates data sets
+    Creates data sets, players are fetched concurrently while sharing the fetcher's rate limiter
+    :param fetcher: data fetcher
     :param players: players to create dataframes for
+    :param num_games: number of games to be used in rolling averages
+    :param workers: number of players fetched at once
+    :param incremental: only fetch and append games newer than the ones already stored
     """
-    for player in players:
-        fetcher.create_player_dataset(player, num_games)
+    if incremental:
+        fetcher.update_player_datasets(players, num_games, workers)
+    else:
+        fetcher.create_player_datasets(players, num_games, workers)
 
-def visualize_player_outcomes(player="Stephen Curry"):
+def visualize_player_outcomes(fetcher, model, player="Stephen Curry", n=N_SIMULATIONS):
     """
     Visualizes the outcomes of a monte carlo simulation for the player's upcoming game
+    :param fetcher: data fetcher
+    :param model: trained model
     :param player: player to consider
+    :param n: number of simulations
     """
+    from Dashboard import Dashboard
     info = fetcher.get_player_props(player)
     if info is not None:
         date = info['date'] # %mm/%dd/%yyyy
         line = info['over']['line']
         input = fetcher.create_player_model_input(player, date)
-        preds = model.simulate(input, ['REST'], n)
-        dashboard.plot_prediction_distribution(preds, line, player)
+        if input is None:
+            print(f"No model input available for {player} on {date}.")
+            return
+        preds = model.simulate_batch(input, ['REST'], n)
+        Dashboard().plot_prediction_distribution(preds, line, player)
 
-def get_highest_evs_tonight(certainty_line=0.9):
+def get_slate_inputs(fetcher):
     """
-    Gets the players with the highest ev tonight, considering all players with available props
-    :return: df of players, containing prediction information
+    Builds the model inputs of every player with available props
+    :param fetcher: data fetcher
+    :return: tuple of props dict and df of inputs indexed by player (players without data are skipped)
     """
-    results = {'PLAYER': [], 'LINE': [], 'OUTCOME': [], 'P_OUTCOME': [], 'EV': []}
-    for player in odds_dict:
-        info = fetcher.get_player_props(player)
-        date = info['date']
-        line = info['over']['line']
-        over_price = info['over']['price']
-        under_price = info['under']['price']
-        input = fetcher.create_player_model_input(player, date)
-        if input is not None:
-            preds = model.simulate(input, ['REST'], n)
-            over_count = 0
-            for pred in preds:
-                if pred > line:
-                    over_count += 1
-            p_over = over_count / n
-            p_under = 1 - p_over
-            over_ev = (p_over * (1  - over_price)) - (1 - p_over)
-            under_ev = (p_under * (1 - under_price)) - (1 - p_under)
-            found = False
-            if p_over > certainty_line:
-                better_ev = over_ev
-                better_bet = 'OVER'
-                p_outcome = p_over
-                found = True
-            elif p_under > certainty_line:
-                found = True
-                better_ev = under_ev
-                better_bet = 'UNDER'
-                p_outcome = p_under
-            else:
-                continue
-            if found:
-                results['PLAYER'] += [player]
-                results['LINE'] = [line]
-                results['OUTCOME'] += [better_bet]
-                results['P_OUTCOME'] += [p_outcome]
-                results['EV'] += [better_ev]
-    df = pd.DataFrame(results)
+    with profiler.span("stage.props"):
+        props = fetcher.get_all_player_props()
+    with profiler.span("stage.model_inputs"):
+        inputs = fetcher.create_players_model_input({player: info['date'] for player, info in props.items()})
+    return props, inputs
+
+def get_probabilities_over(model, inputs, lines, method='mc', n=N_SIMULATIONS, certainty_line=0.9):
+    """
+    Prices every player's line
+    :param model: trained model
+    :param inputs: one input row per player
+    :param lines: betting line of each player
+    :param method: 'mc' for the monte carlo simulation, 'adaptive' for the early-stopping monte carlo,
+    'empirical' for the closed-form residual distribution
+    :param n: number of simulations per player, the max number of draws per player when adaptive
+    :param certainty_line: probability an outcome needs before it is bet on, used to stop adaptive draws early
+    :return: array of probabilities of hitting the over
+    """
+    import numpy as np
+    from Calculator import Calculator
+    if method == 'empirical':
+        return Calculator().empirical_probability_over(lines, model.predict(inputs), model.residuals)
+    if method == 'adaptive':
+        results = [model.simulate_adaptive(inputs.iloc[[i]], line, ['REST'], certainty_line, max_draws=n)
+                   for i, line in enumerate(lines)]
+        print(f"Adaptive simulation used {sum(result['draws'] for result in results)} draws "
+              f"for {len(results)} players.")
+        return np.array([result['p_over'] for result in results])
+    preds = model.simulate_slate(inputs, ['REST'], n)
+    return (preds > lines[:, None]).mean(axis=1)
+
+def get_highest_evs_tonight(fetcher, model, certainty_line=0.9, n=N_SIMULATIONS, method='mc'):
+    """
+    Gets the players with the highest ev tonight, considering all players with available props.
+    Inputs for the whole slate are priced together with array operations
+    :param fetcher: data fetcher
+    :param model: trained model
+    :param certainty_line: minimum probability an outcome needs before it is considered
+    :param n: number of simulations per player
+    :param method: 'mc', 'adaptive' or 'empirical', see get_probabilities_over
+    :return: df of players, containing prediction information, ranked by ev
+    """
+    import numpy as np
+    import pandas as pd
+    from Calculator import Calculator
+    calculator = Calculator()
+
+    props, inputs = get_slate_inputs(fetcher)
+    columns = ['PLAYER', 'LINE', 'OUTCOME', 'P_OUTCOME', 'EV']
+    if inputs.empty:
+        print("No player inputs available for tonight's slate.")
+        return pd.DataFrame(columns=columns)
+
+    players = inputs.index.tolist()
+    lines = np.array([props[player]['over']['line'] for player in players])
+    over_prices = np.array([props[player]['over']['price'] for player in players])
+    under_prices = np.array([props[player]['under']['price'] for player in players])
+
+    with profiler.span("stage.pricing"):
+        p_over = get_probabilities_over(model, inputs, lines, method, n, certainty_line)
+    p_under = 1 - p_over
+    over_ev = calculator.expected_value(p_over, over_prices)
+    under_ev = calculator.expected_value(p_under, under_prices)
+
+    is_over = p_over > certainty_line
+    is_under = ~is_over & (p_under > certainty_line)
+    df = pd.DataFrame({
+        'PLAYER': players,
+        'LINE': lines,
+        'OUTCOME': np.where(is_over, 'OVER', 'UNDER'),
+        'P_OUTCOME': np.where(is_over, p_over, p_under),
+        'EV': np.where(is_over, over_ev, under_ev)
+    })
+    df = df[is_over | is_under].sort_values('EV', ascending=False).reset_index(drop=True)
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None):
+        print(df)
+    return df
+
+def get_highest_evs_all_markets(fetcher, model, certainty_line=0.9, n=N_SIMULATIONS):
+    """
+    Gets the props with the highest ev tonight across every market, all stats of the slate are simulated
+    with a single predict call of the multi-target model
+    :param fetcher: data fetcher
+    :param model: trained MultiTargetModel
+    :param certainty_line: minimum probability an outcome needs before it is considered
+    :param n: number of simulations per player
+    :return: df of props, containing prediction information, ranked by ev
+    """
+    import numpy as np
+    import pandas as pd
+    from Calculator import Calculator
+    calculator = Calculator()
+
+    props, inputs = get_slate_inputs(fetcher)
+    columns = ['PLAYER', 'MARKET', 'LINE', 'OUTCOME', 'P_OUTCOME', 'EV']
+    if inputs.empty:
+        print("No player inputs available for tonight's slate.")
+        return pd.DataFrame(columns=columns)
+
+    players = inputs.index.tolist()
+    with profiler.span("stage.pricing"):
+        outcomes = model.simulate_markets(inputs, ['REST'], n)
+    rows = []
+    for stat, preds in outcomes.items():
+        # players without a line in this market are skipped
+        priced = [(i, props[player]['markets'][stat]) for i, player in enumerate(players)
+                  if 'over' in props[player].get('markets', {}).get(stat, {})
+                  and 'under' in props[player]['markets'][stat]]
+        if not priced:
+            continue
+        index = np.array([i for i, _ in priced])
+        lines = np.array([market['over']['line'] for _, market in priced])
+        p_over = (preds[index] > lines[:, None]).mean(axis=1)
+        p_under = 1 - p_over
+        over_ev = calculator.expected_value(p_over, np.array([market['over']['price'] for _, market in priced]))
+        under_ev = calculator.expected_value(p_under, np.array([market['under']['price'] for _, market in priced]))
+        is_over = p_over > certainty_line
+        rows.append(pd.DataFrame({
+            'PLAYER': [players[i] for i in index],
+            'MARKET': stat,
+            'LINE': lines,
+            'OUTCOME': np.where(is_over, 'OVER', 'UNDER'),
+            'P_OUTCOME': np.where(is_over, p_over, p_under),
+            'EV': np.where(is_over, over_ev, under_ev)
+        })[is_over | (p_under > certainty_line)])
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(rows, ignore_index=True).sort_values('EV', ascending=False).reset_index(drop=True)
     with pd.option_context('display.max_rows', None, 'display.max_columns', None):
         print(df)
+    return df
+
+def calibration_report(fetcher, model, n=N_SIMULATIONS):
+    """
+    Compares the closed-form probabilities against the monte carlo ones on tonight's slate
+    :param fetcher: data fetcher
+    :param model: trained model
+    :param n: number of simulations per player
+    :return: df with both probabilities of hitting the over for every player
+    """
+    import numpy as np
+    import pandas as pd
+
+    props, inputs = get_slate_inputs(fetcher)
+    if inputs.empty:
+        print("No player inputs available for tonight's slate.")
+        return pd.DataFrame(columns=['PLAYER', 'LINE', 'P_OVER_MC', 'P_OVER_EMPIRICAL', 'DIFF'])
+    players = inputs.index.tolist()
+    lines = np.array([props[player]['over']['line'] for player in players])
+    df = pd.DataFrame({
+        'PLAYER': players,
+        'LINE': lines,
+        'P_OVER_MC': get_probabilities_over(model, inputs, lines, 'mc', n),
+        'P_OVER_EMPIRICAL': get_probabilities_over(model, inputs, lines, 'empirical')
+    })
+    df['DIFF'] = df['P_OVER_EMPIRICAL'] - df['P_OVER_MC']
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None):
+        print(df)
+    print(f"Mean absolute difference: {df['DIFF'].abs().mean():.3f}, max: {df['DIFF'].abs().max():.3f}")
+    return df
+
+def backtest_model(fetcher, seasons=None, method='normal', retrain_every=7, min_train_rows=500, min_ev=0.0,
+                   n=N_SIMULATIONS, odds_dir=None, workers=4, output=None):
+    """
+    Walk-forward backtest of the points model over the training store
+    :param fetcher: data fetcher owning the training store
+    :param seasons: seasons to backtest, all stored seasons if None
+    :param method: 'normal', 'empirical' or 'mc', see Backtest
+    :param retrain_every: number of days priced by each model
+    :param min_train_rows: games needed before the first priced date
+    :param min_ev: minimum ev of a bet
+    :param n: number of simulations per player when method is 'mc'
+    :param odds_dir: directory of saved odds files, synthetic lines are used for games without odds
+    :param workers: number of blocks trained and priced at once
+    :param output: csv file every priced game is written to
+    :return: dict of summary stats
+    """
+    import pandas as pd
+    from Backtest import Backtest
+    store = fetcher.training_store
+    if store.is_empty():
+        store.import_csv_dir(PLAYER_DATA_DIR, fetcher.season)
+    backtest = Backtest(store, fetcher.FEATURES, method=method, retrain_every=retrain_every,
+                        min_train_rows=min_train_rows, min_ev=min_ev, n=n, workers=workers)
+    if odds_dir is not None:
+        backtest.load_odds_history(odds_dir)
+    results = backtest.run(seasons)
+    summary = backtest.summarize(results)
+    for name, value in summary.items():
+        print(f"{name:<18} {value:.3f}" if isinstance(value, float) else f"{name:<18} {value}")
+    if not results.empty:
+        with pd.option_context('display.max_rows', None, 'display.max_columns', None):
+            print(backtest.calibration_table(results))
+        if output is not None:
+            results.to_csv(output, index=False)
+    return summary
+
+def tune_model(fetcher, search='grid', trials=20, folds=5, workers=None):
+    """
+    Searches the CatBoost settings of the points model with k-fold cross-validation and saves the best ones,
+    create_model uses them from then on
+    :param fetcher: data fetcher owning the training store
+    :param search: 'grid' or 'random'
+    :param trials: number of settings tried by a random search
+    :param folds: number of cross-validation folds
+    :param workers: number of trials run at once
+    :return: dict of the best settings
+    """
+    from Model import Model
+    from Tuner import Tuner
+    store = fetcher.training_store
+    if store.is_empty():
+        store.import_csv_dir(PLAYER_DATA_DIR, fetcher.season)
+    tuner = Tuner(fetcher.FEATURES, folds=folds, search=search, trials=trials, workers=workers)
+    results = tuner.tune(store.load(columns=fetcher.FEATURES + ['PTS']))
+    best = tuner.save_best(results)
+    print(f"Best settings: {best} (cv mae {results[0]['mae']:.3f}), saved to {Model.TUNED_PARAMS_FILE}")
+    return best
+
+def run_refresh(args):
+    """
+    Handles the refresh command, rebuilds the training data of the given players or of the initial portfolio
+    :param args: parsed command line arguments
+    """
+    from Portfolio import Portfolio
+    players = args.players or Portfolio.INITIAL_PORTFOLIO
+    refresh_data_files(create_fetcher(args.transport), players, args.num_games, args.workers, args.incremental)
+
+def run_train(args):
+    """
+    Handles the train command, trains the points model if the training data changed and prints its error
+    :param args: parsed command line arguments
+    """
+    model = create_model(create_fetcher(args.transport), force_train=args.force)
+    print(f"Model MAE: {model.mae:.3f}")
+
+def run_scan(args):
+    """
+    Handles the scan command, prints the best bets of tonight's slate on points or on every market
+    :param args: parsed command line arguments
+    """
+    fetcher = create_fetcher(args.transport)
+    if args.all_markets:
+        model = create_multi_model(fetcher)
+        if model is not None:
+            get_highest_evs_all_markets(fetcher, model, args.certainty_line, args.simulations)
+        return
+    get_highest_evs_tonight(fetcher, create_model(fetcher), args.certainty_line, args.simulations, args.method)
+
+def run_calibrate(args):
+    """
+    Handles the calibrate command, compares the closed-form and monte carlo probabilities on tonight's slate
+    :param args: parsed command line arguments
+    """
+    fetcher = create_fetcher(args.transport)
+    calibration_report(fetcher, create_model(fetcher), args.simulations)
+
+def run_visualize(args):
+    """
+    Handles the visualize command, plots the simulated outcomes of a player's upcoming game
+    :param args: parsed command line arguments
+    """
+    fetcher = create_fetcher(args.transport)
+    visualize_player_outcomes(fetcher, create_model(fetcher), args.player, args.simulations)
+
+def run_backtest(args):
+    """
+    Handles the backtest command, runs the walk-forward backtest and prints its summary
+    :param args: parsed command line arguments
+    """
+    backtest_model(create_fetcher(args.transport), args.seasons, args.method, args.retrain_every, args.min_train_rows,
+                   args.min_ev, args.simulations, args.odds_dir, args.workers, args.output)
+
+def run_tune(args):
+    """
+    Handles the tune command, searches the model's settings and saves the best ones
+    :param args: parsed command line arguments
+    """
+    tune_model(create_fetcher(args.transport), args.search, args.trials, args.folds, args.workers)
+
+def run_portfolio_evaluate(args):
+    """
+    Handles the portfolio evaluate command, settles the pending bets and evaluates every player of the portfolio
+    :param args: parsed command line arguments
+    """
+    fetcher = create_fetcher(args.transport)
+    create_portfolio(fetcher, create_model(fetcher)).evaluate_all(args.category)
+
+def create_parser():
+    """
+    Builds the command line interface
+    :return: argparse parser
+    """
+    parser = argparse.ArgumentParser(description="NBA player prop prediction model")
+    parser.add_argument("--transport", choices=Transport.MODES, default=Transport.PASSTHROUGH,
+                        help="record the api responses to the fixture archive or replay them without network access")
+    parser.add_argument("--fixtures", default=Transport.DEFAULT_ARCHIVE, help="fixture archive to record to or replay")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"record api calls, sleeps and stage timings and write a report to "
+                             f"{profiler.DEFAULT_REPORT_DIR}/ (same as {profiler.ENV_VAR}=1)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    refresh = subparsers.add_parser("refresh", help="rebuild player training datasets")
+    refresh.add_argument("players", nargs="*", help="players to refresh, defaults to the initial portfolio")
+    refresh.add_argument("--num-games", type=int, default=5, help="games used in rolling averages")
+    refresh.add_argument("--workers", type=int, default=8, help="players fetched at once")
+    refresh.add_argument("--incremental", action="store_true",
+                         help="only fetch and append games newer than the ones already stored")
+    refresh.set_defaults(func=run_refresh)
+
+    train = subparsers.add_parser("train", help="train the model if the training data changed")
+    train.add_argument("--force", action="store_true", help="retrain even if the saved model is up to date")
+    train.set_defaults(func=run_train)
+
+    tune = subparsers.add_parser("tune", help="cross-validated search of the model's settings")
+    tune.add_argument("--search", choices=["grid", "random"], default="grid", help="grid or random search")
+    tune.add_argument("--trials", type=int, default=20, help="settings tried by a random search")
+    tune.add_argument("--folds", type=int, default=5, help="cross-validation folds")
+    tune.add_argument("--workers", type=int, help="trials run at once, defaults to half the cpus")
+    tune.set_defaults(func=run_tune)
+
+    scan = subparsers.add_parser("scan", help="rank tonight's props by expected value")
+    scan.add_argument("--certainty-line", type=float, default=0.9,
+                      help="minimum probability an outcome needs before it is considered")
+    scan.add_argument("-n", "--simulations", type=int, default=N_SIMULATIONS, help="simulations per player")
+    scan.add_argument("--method", choices=["mc", "adaptive", "empirical"], default="mc",
+                      help="monte carlo simulation, early-stopping monte carlo or closed-form residual distribution")
+    scan.add_argument("--all-markets", action="store_true",
+                      help="price points, rebounds, assists, threes and PRA with the multi-target model (monte carlo)")
+    scan.set_defaults(func=run_scan)
+
+    calibrate = subparsers.add_parser("calibrate", help="compare closed-form and monte carlo probabilities")
+    calibrate.add_argument("-n", "--simulations", type=int, default=N_SIMULATIONS, help="simulations per player")
+    calibrate.set_defaults(func=run_calibrate)
+
+    visualize = subparsers.add_parser("visualize", help="plot the simulated outcomes of a player's next game")
+    visualize.add_argument("player", help="player to consider")
+    visualize.add_argument("-n", "--simulations", type=int, default=N_SIMULATIONS, help="number of simulations")
+    visualize.set_defaults(func=run_visualize)
+
+    backtest = subparsers.add_parser("backtest", help="walk-forward backtest of the model over the training data")
+    backtest.add_argument("--seasons", nargs="*", help="seasons to backtest, defaults to every stored season")
+    backtest.add_argument("--method", choices=["normal", "empirical", "mc"], default="normal",
+                          help="normal distribution around the prediction, residual distribution or monte carlo")
+    backtest.add_argument("--retrain-every", type=int, default=7, help="days priced by each model")
+    backtest.add_argument("--min-train-rows", type=int, default=500, help="games needed before the first priced date")
+    backtest.add_argument("--min-ev", type=float, default=0.0, help="minimum ev of a bet")
+    backtest.add_argument("-n", "--simulations", type=int, default=N_SIMULATIONS,
+                          help="simulations per player with --method mc")
+    backtest.add_argument("--odds-dir", help="directory of saved odds files, synthetic lines are used otherwise")
+    backtest.add_argument("--workers", type=int, default=4, help="models trained at once")
+    backtest.add_argument("--output", help="csv file every priced game is written to")
+    backtest.set_defaults(func=run_backtest)
+
+    portfolio = subparsers.add_parser("portfolio", help="manage the betting portfolio")
+    portfolio_commands = portfolio.add_subparsers(dest="portfolio_command", required=True)
+    evaluate = portfolio_commands.add_parser("evaluate", help="settle past bets and price upcoming ones")
+    evaluate.add_argument("--category", default="PTS", help="statistical category")
+    evaluate.set_defaults(func=run_portfolio_evaluate)
+    return parser
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    if args.profile:
+        profiler.enable()
+    args.transport = Transport(args.transport, args.fixtures)
+    try:
+        with profiler.span(f"command.{args.command}"):
+            args.func(args)
+    finally:
+        # a failed run is kept too, so it can be replayed to reproduce the failure
+        args.transport.save()
+    if profiler.enabled:
+        profiler.print_summary()
+        print(f"Profile written to {profiler.write_report(name=args.command)}")
 
 if __name__=="__main__":
-    visualize_player_outcomes("Rudy Gobert")
-    # refresh_data_files()
-    # get_highest_evs_tonight()
+    main()
@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from contextlib import closing
+from ApiCache import ApiCache
+
+PARAMS = {'season': "2024-25", 'date_from_nullable': "05/01/2025", 'date_to_nullable': "05/01/2025"}
+
+class TestApiCache(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.path = os.path.join(self.workdir.name, "api_cache.sqlite")
+        self.cache = ApiCache(self.path)
+
+    def test_fresh_response_is_served(self):
+        self.cache.set('LeagueGameLog', PARAMS, {'rows': 1}, ApiCache.HOUR)
+        self.assertEqual(self.cache.get('LeagueGameLog', PARAMS), {'rows': 1})
+        self.assertIsNone(self.cache.get('LeagueGameLog', PARAMS | {'season': "2023-24"}))
+
+    def test_short_ttl_expires_however_it_is_read_later(self):
+        # a date fetched while its games were running, read once the date became final
+        self.cache.set('LeagueGameLog', PARAMS, {'rows': 1}, 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('LeagueGameLog', PARAMS))
+
+    def test_permanent_response_never_expires(self):
+        self.cache.set('LeagueGameLog', PARAMS, {'rows': 2}, ApiCache.NEVER)
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute("UPDATE responses SET fetched_at = 0")
+        self.assertEqual(self.cache.get('LeagueGameLog', PARAMS), {'rows': 2})
+
+    def test_rewrite_replaces_the_expiry(self):
+        self.cache.set('LeagueGameLog', PARAMS, {'rows': 1}, 0.05)
+        self.cache.set('LeagueGameLog', PARAMS, {'rows': 2}, ApiCache.NEVER)
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get('LeagueGameLog', PARAMS), {'rows': 2})
+
+    def test_cache_without_expiries_is_dropped(self):
+        path = os.path.join(self.workdir.name, "old_cache.sqlite")
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.execute("CREATE TABLE responses (key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, "
+                         "fetched_at REAL NOT NULL, payload TEXT NOT NULL)")
+            conn.execute("INSERT INTO responses VALUES (?, ?, ?, ?)",
+                         (self.cache.make_key('LeagueGameLog', PARAMS), 'LeagueGameLog', time.time(), "{}"))
+        cache = ApiCache(path)
+        self.assertIsNone(cache.get('LeagueGameLog', PARAMS))
+        cache.set('LeagueGameLog', PARAMS, {'rows': 1}, ApiCache.DAY)
+        self.assertEqual(cache.get('LeagueGameLog', PARAMS), {'rows': 1})
+
+if __name__ == '__main__':
+    unittest.main()
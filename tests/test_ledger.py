@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import unittest
+from Ledger import Ledger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEGACY_PORTFOLIO_FILE = os.path.join(ROOT, "betting_data", "portfolio.json")
+
+def empty_history():
+    """
+    :return: history of a player of the json portfolio without any bet
+    """
+    return {'ev': [], 'actual': [], 'predicted': [], 'line': [], 'date': []}
+
+class TestLedgerMigration(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.ledger = Ledger(os.path.join(self.workdir.name, "portfolio.db"))
+
+    def write_portfolio(self, players):
+        """
+        :param players: dict of player name to history, as in the json portfolio
+        :return: path of the json portfolio
+        """
+        path = os.path.join(self.workdir.name, "portfolio.json")
+        with open(path, 'w') as f:
+            json.dump(players, f)
+        return path
+
+    def test_merged_key_becomes_two_players(self):
+        path = self.write_portfolio({'Stephen Curry': empty_history(),
+                                     'Donovan MitchellEvan Mobley': empty_history(),
+                                     'Kawhi Leonard': empty_history()})
+        known_players = ['Stephen Curry', 'Donovan Mitchell', 'Evan Mobley', 'Kawhi Leonard']
+        self.assertTrue(self.ledger.migrate_from_json(path, known_players=known_players))
+        self.assertEqual(self.ledger.get_players(), known_players)
+
+    def test_bets_are_imported_with_their_settlements(self):
+        history = {'ev': [0.1, 0.2], 'actual': [25.0], 'predicted': [24.0, 21.0], 'line': [22.5, 23.5],
+                   'date': ['01/02/2025', '01/04/2025']}
+        path = self.write_portfolio({'Stephen Curry': history})
+        self.ledger.migrate_from_json(path, known_players=['Stephen Curry'])
+        bets = self.ledger.get_history(player_name='Stephen Curry', market='PTS')
+        self.assertEqual([bet['line'] for bet in bets], [22.5, 23.5])
+        self.assertEqual([bet['actual'] for bet in bets], [25.0, None])
+
+    def test_legacy_portfolio_has_both_players(self):
+        self.assertTrue(self.ledger.migrate_from_json(LEGACY_PORTFOLIO_FILE))
+        players = self.ledger.get_players()
+        self.assertIn('Donovan Mitchell', players)
+        self.assertIn('Evan Mobley', players)
+        self.assertNotIn('Donovan MitchellEvan Mobley', players)
+
+    def test_nothing_is_imported_into_a_ledger_with_players(self):
+        self.ledger.add_player('Stephen Curry')
+        path = self.write_portfolio({'Kawhi Leonard': empty_history()})
+        self.assertFalse(self.ledger.migrate_from_json(path))
+        self.assertEqual(self.ledger.get_players(), ['Stephen Curry'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from ApiCache import ApiCache
+from DataFetcher import DataFetcher
+from OddsClient import OddsClient
+from RateLimiter import RateLimitError
+from TrainingStore import TrainingStore
+from Transport import Transport
+
+EVENT_IDS = [f"event{i}" for i in range(10)]
+
+def get_event_odds(event_id):
+    """
+    :param event_id: id of the event
+    :return: odds of the event as the Odds API returns them, one draftkings points line for one player
+    """
+    return {
+        'id': event_id,
+        'commence_time': "2025-05-01T23:30:00Z",
+        'bookmakers': [{
+            'key': "draftkings",
+            'markets': [{
+                'key': "player_points",
+                'outcomes': [
+                    {'name': "Over", 'description': f"Player {event_id}", 'point': 20.5, 'price': 1.87},
+                    {'name': "Under", 'description': f"Player {event_id}", 'point': 20.5, 'price': 1.95}
+                ]
+            }]
+        }]
+    }
+
+class StubOddsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """
+        Serves the events and event odds endpoints, later events answer sooner so responses finish out of order
+        """
+        server = self.server
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        with server.lock:
+            server.queries.append(parse_qs(url.query))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if server.rate_limited:
+                status, body = 429, "Too Many Requests"
+            elif parts == ['sports', 'basketball_nba', 'events']:
+                status, body = 200, json.dumps([{'id': event_id} for event_id in EVENT_IDS])
+            elif len(parts) == 5 and parts[:3] == ['sports', 'basketball_nba', 'events'] and parts[4] == 'odds':
+                time.sleep(0.02 * (len(EVENT_IDS) - EVENT_IDS.index(parts[3])))
+                status, body = 200, json.dumps(get_event_odds(parts[3]))
+            else:
+                status, body = 404, "Unknown path"
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestOddsClient(unittest.TestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubOddsHandler)
+        server.lock = threading.Lock()
+        server.queries = []
+        server.in_flight = 0
+        server.max_in_flight = 0
+        server.rate_limited = False
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        self.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def test_event_odds_come_back_in_event_order(self):
+        client = OddsClient("test-key", self.base_url)
+        self.addCleanup(client.close)
+        all_odds = client.get_all_event_odds("basketball_nba", EVENT_IDS, markets="player_points,player_assists")
+        self.assertEqual([odds['id'] for odds in all_odds], EVENT_IDS)
+        self.assertGreater(self.server.max_in_flight, 1)
+        for query in self.server.queries:
+            self.assertEqual(query['apiKey'], ["test-key"])
+            self.assertEqual(query['markets'], ["player_points,player_assists"])
+            self.assertEqual(query['regions'], ["us"])
+
+    def test_concurrency_is_capped(self):
+        client = OddsClient("test-key", self.base_url, max_concurrency=3)
+        self.addCleanup(client.close)
+        client.get_all_event_odds("basketball_nba", EVENT_IDS)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+
+    def test_rate_limited_response_raises(self):
+        self.server.rate_limited = True
+        client = OddsClient("test-key", self.base_url)
+        self.addCleanup(client.close)
+        with self.assertRaises(RateLimitError):
+            client.get_upcoming_events()
+
+    def test_fetcher_writes_the_odds_of_every_event(self):
+        workdir = tempfile.mkdtemp(prefix="nba_test_")
+        fetcher = DataFetcher(cache=ApiCache(os.path.join(workdir, "cache.db")),
+                              training_store=TrainingStore(os.path.join(workdir, "training_data")),
+                              odds_base_url=self.base_url)
+        self.addCleanup(fetcher.close)
+        fetcher.odds_client.api_key = "test-key"
+        fetcher.odds_file = os.path.join(workdir, "odds.json")
+        fetcher.update_odds_file()
+        with open(fetcher.odds_file, 'r') as f:
+            odds = json.load(f)
+        self.assertEqual(list(odds), [f"Player {event_id}" for event_id in EVENT_IDS])
+        self.assertEqual(odds["Player event0"]['date'], "05/01/2025")
+        self.assertEqual(odds["Player event0"]['over'], {'line': 20.5, 'price': 1.87})
+        self.assertEqual(odds["Player event0"]['markets']['PTS']['under'], {'line': 20.5, 'price': 1.95})
+
+    def test_recorded_run_keeps_its_odds_file_until_closed(self):
+        workdir = tempfile.mkdtemp(prefix="nba_test_")
+        fetcher = DataFetcher(cache=ApiCache(os.path.join(workdir, "cache.db")),
+                              training_store=TrainingStore(os.path.join(workdir, "training_data")),
+                              transport=Transport(Transport.RECORD, os.path.join(workdir, "recording.json.gz")),
+                              odds_base_url=self.base_url)
+        self.assertNotEqual(fetcher.odds_file, DataFetcher.ODDS_FILE)
+        odds_dir = os.path.dirname(fetcher.odds_file)
+        self.assertTrue(os.path.isdir(odds_dir))
+        fetcher.close()
+        self.assertFalse(os.path.exists(odds_dir))
+
+if __name__ == '__main__':
+    unittest.main()
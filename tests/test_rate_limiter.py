@@ -0,0 +1,177 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from ApiCache import ApiCache
+from DataFetcher import DataFetcher
+from RateLimiter import RateLimitError, TokenBucket
+from TrainingStore import TrainingStore
+
+RATE = 10 # requests per second of the fetchers under test
+SLACK = 0.2 # share of the spacing a gap may fall short by, timers and thread switches are not exact
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """
+        Answers with the next status of the server's script, the last status is repeated once the script runs out
+        """
+        server = self.server
+        with server.lock:
+            server.times.append(time.monotonic())
+            status = server.statuses[min(len(server.times), len(server.statuses)) - 1]
+        # like stats.nba.com, a rate-limited response has a body that isn't json
+        body = b"Too Many Requests"
+        if status == 200:
+            body = json.dumps({'StubEndpoint': {'headers': ['PTS'], 'data': [[30]]}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubEndpoint:
+    url = None # set by the test to its server's url
+
+    def __init__(self, **params):
+        """
+        Endpoint shaped like nba_api's, which doesn't check the status code and parses the body as json
+        :param params: query parameters
+        """
+        response = requests.get(self.url, params=params, timeout=5)
+        self.nba_response = self
+        self.text = response.text
+
+    def get_response(self):
+        """
+        :return: raw body of the response
+        """
+        return self.text
+
+    def get_data_sets(self):
+        """
+        :return: dict of data set name to headers and data, raises JSONDecodeError on a rate-limit page
+        """
+        return json.loads(self.text)
+
+class TestRateLimiter(unittest.TestCase):
+    def start_server(self, statuses):
+        """
+        Starts a local server answering every request with the given statuses in order, the stub endpoint
+        sends its requests to it
+        :param statuses: list of HTTP status codes
+        """
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        server.statuses = statuses
+        server.times = []
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        StubEndpoint.url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    def create_fetcher(self, burst=1):
+        """
+        :param burst: burst of the fetcher's token bucket
+        :return: DataFetcher with its cache and training data in a temporary directory and fast retries
+        """
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        fetcher = DataFetcher(cache=ApiCache(os.path.join(workdir.name, "cache.db")),
+                              rate_limiter=TokenBucket(RATE, burst),
+                              training_store=TrainingStore(os.path.join(workdir.name, "training_data")))
+        self.addCleanup(fetcher.close)
+        fetcher.MAX_RETRIES = 2
+        fetcher.BACKOFF_SECONDS = 0.05
+        return fetcher
+
+    def get_gaps(self):
+        """
+        :return: list of seconds between consecutive requests the server received
+        """
+        times = sorted(self.server.times)
+        return [later - earlier for earlier, later in zip(times, times[1:])]
+
+    def test_requests_are_spaced_by_the_rate(self):
+        self.start_server([200])
+        fetcher = self.create_fetcher()
+        for game_id in range(6):
+            games = fetcher.call_endpoint(StubEndpoint, game_id=game_id)['StubEndpoint']
+            self.assertEqual(games['PTS'].tolist(), [30])
+        self.assertEqual(len(self.server.times), 6)
+        for gap in self.get_gaps():
+            self.assertGreaterEqual(gap, (1 - SLACK) / RATE)
+
+    def test_burst_is_sent_back_to_back(self):
+        self.start_server([200])
+        fetcher = self.create_fetcher(burst=3)
+        start = time.monotonic()
+        for game_id in range(3):
+            fetcher.call_endpoint(StubEndpoint, game_id=game_id)
+        # spaced by the rate they would take at least two gaps
+        self.assertLess(time.monotonic() - start, 2 * (1 - SLACK) / RATE)
+        self.assertGreater(fetcher.rate_limiter.acquire(), 0.0)
+
+    def test_threads_share_the_rate(self):
+        self.start_server([200])
+        fetcher = self.create_fetcher()
+        threads = [threading.Thread(target=fetcher.call_endpoint, args=(StubEndpoint,), kwargs={'game_id': game_id})
+                   for game_id in range(8)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the first request goes out right away, the seven others wait for a token each
+        self.assertGreaterEqual(time.monotonic() - start, 7 * (1 - SLACK) / RATE)
+        self.assertEqual(len(self.server.times), 8)
+        for gap in self.get_gaps():
+            self.assertGreaterEqual(gap, (1 - SLACK) / RATE)
+
+    def test_cached_responses_skip_the_limiter(self):
+        self.start_server([200])
+        fetcher = self.create_fetcher()
+        fetcher.call_endpoint(StubEndpoint, game_id=1)
+        start = time.monotonic()
+        for _ in range(5):
+            fetcher.call_endpoint(StubEndpoint, game_id=1)
+        self.assertLess(time.monotonic() - start, 4 * (1 - SLACK) / RATE)
+        self.assertEqual(len(self.server.times), 1)
+
+    def test_retries_with_backoff_after_rate_limit(self):
+        self.start_server([429, 429, 200])
+        fetcher = self.create_fetcher()
+        games = fetcher.call_endpoint(StubEndpoint, game_id=1)['StubEndpoint']
+        self.assertEqual(games['PTS'].tolist(), [30])
+        self.assertEqual(len(self.server.times), 3)
+        gaps = self.get_gaps()
+        self.assertGreaterEqual(gaps[0], fetcher.BACKOFF_SECONDS * (1 - SLACK))
+        self.assertGreaterEqual(gaps[1], 2 * fetcher.BACKOFF_SECONDS * (1 - SLACK))
+
+    def test_raises_rate_limit_error_when_retries_run_out(self):
+        self.start_server([429])
+        fetcher = self.create_fetcher()
+        with self.assertRaises(RateLimitError):
+            fetcher.call_endpoint(StubEndpoint, game_id=1)
+        self.assertEqual(len(self.server.times), fetcher.MAX_RETRIES + 1)
+
+    def test_other_errors_are_not_retried(self):
+        fetcher = self.create_fetcher()
+        attempts = []
+
+        def request():
+            attempts.append(1)
+            raise ValueError("bad parameters")
+
+        with self.assertRaises(ValueError):
+            fetcher.send_request(request)
+        self.assertEqual(len(attempts), 1)
+
+if __name__ == '__main__':
+    unittest.main()